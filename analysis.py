@@ -0,0 +1,105 @@
+"""Batch analysis of many positions, streamed from FEN or EPD lines to one JSON result per line"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.util import Finalize
+from board import Board, Position, line_to_fen
+from cache import AnalysisCache
+from bitboard import COLOR_NAMES
+from engine import Engine, DEFAULT_HASH_MB
+from models import move_to_uci
+from stats import SearchStats
+
+_caches = {} #analysis caches opened by this process, by path, kept open so their writes are batched
+
+def process_cache(path : str) -> AnalysisCache:
+    """The analysis cache of this process for the file, opened on first use and closed, writing what is pending, when the
+    process exits, including the worker processes of a pool"""
+    cache = _caches.get(path)
+    if cache is None:
+        cache = _caches[path] = AnalysisCache(path)
+        Finalize(cache, cache.close, exitpriority=10)
+    return cache
+
+def analyze_position(index : int, fen : str, depth : int = None, movetime_ms : int = None, nodes : int = None,
+                     hash_mb : float = DEFAULT_HASH_MB, collect_stats : bool = False, cache_path : str = None) -> dict:
+    """Searches a single position, returns the result as a dictionary ready to be written as JSON.
+    With a cache_path, results already in that analysis cache are reused and new ones are added to it, see process_cache"""
+    result = {"index": index, "fen": fen}
+    board = Board()
+    try:
+        board.position = Position(fen)
+    except (ValueError, IndexError):
+        result["error"] = "invalid FEN"
+        return result
+    engine = Engine(board, COLOR_NAMES[board.position.turn], hash_mb=hash_mb)
+    if collect_stats:
+        engine.stats = SearchStats()
+    if cache_path is not None:
+        engine.cache = process_cache(cache_path)
+    start = time.perf_counter()
+    move = engine.search(depth, movetime_ms, nodes)
+    result["bestmove"] = None if move is None else move_to_uci(move.encode())
+    result["score"] = engine.score
+    result["depth"] = engine.completed_depth
+    result["nodes"] = engine.nodes
+    result["time_ms"] = round((time.perf_counter() - start) * 1000)
+    if collect_stats:
+        result["stats"] = engine.stats.as_dict()
+    return result
+
+def analyze_batch(lines, depth : int = None, movetime_ms : int = None, nodes : int = None, workers : int = 1,
+                  max_in_flight : int = None, hash_mb : float = DEFAULT_HASH_MB, collect_stats : bool = False, cache_path : str = None):
+    """Analyzes every FEN or EPD line, yielding results as each one finishes (not necessarily in input order).
+    Lines are only read as work is handed out, at most max_in_flight positions are queued at once, so memory stays flat"""
+    positions = ((index, line_to_fen(line)) for index, line in enumerate(lines) if line.strip() and not line.startswith('#'))
+    if workers <= 1:
+        for index, fen in positions:
+            yield analyze_position(index, fen, depth, movetime_ms, nodes, hash_mb, collect_stats, cache_path)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for index, fen in positions:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(analyze_position, index, fen, depth, movetime_ms, nodes, hash_mb, collect_stats, cache_path))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze FEN or EPD positions, one per line, writing one JSON result per line")
+    parser.add_argument("input", nargs='?', default='-', help="file of positions, standard input by default")
+    parser.add_argument("--output", default='-', help="file to write results to, standard output by default")
+    parser.add_argument("--depth", type=int, default=None, help="depth to search each position to")
+    parser.add_argument("--movetime", type=int, default=None, help="time to search each position for, in milliseconds")
+    parser.add_argument("--nodes", type=int, default=None, help="nodes to search each position for")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="positions queued for the workers at once, twice the workers by default")
+    parser.add_argument("--hash", type=float, default=DEFAULT_HASH_MB, help="transposition table size per search in MB")
+    parser.add_argument("--stats", action="store_true", help="add the search counters and phase times to every result")
+    parser.add_argument("--cache", default=None, help="analysis cache file to reuse earlier results from and add new ones to")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    destination = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for result in analyze_batch(source, args.depth, args.movetime, args.nodes, args.workers, args.max_in_flight, args.hash,
+                                    args.stats, args.cache):
+            destination.write(json.dumps(result) + "\n")
+            destination.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if destination is not sys.stdout:
+            destination.close()
+
+if __name__ == '__main__':
+    main()
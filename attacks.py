@@ -0,0 +1,54 @@
+"""Attack tables for every piece and square, computed once at import time"""
+from bitboard import WHITE, BLACK, NORTH, SOUTH, EAST, WEST, NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST, \
+    knight_attacks, king_attacks, pawn_attacks, sliding_attacks
+
+KNIGHT_ATTACKS = [knight_attacks(1 << square) for square in range(64)]
+KING_ATTACKS = [king_attacks(1 << square) for square in range(64)]
+PAWN_ATTACKS = ([pawn_attacks(1 << square, WHITE) for square in range(64)], [pawn_attacks(1 << square, BLACK) for square in range(64)])
+
+#Rays from each square to the edge of an empty board, per direction.
+#Positive directions run towards higher squares, so their nearest blocker is the lowest set bit; negative ones the highest.
+POSITIVE_RAYS = [[sliding_attacks(square, 0, (direction,)) for square in range(64)] for direction in (NORTH, EAST, NORTH_EAST, NORTH_WEST)]
+NEGATIVE_RAYS = [[sliding_attacks(square, 0, (direction,)) for square in range(64)] for direction in (SOUTH, WEST, SOUTH_EAST, SOUTH_WEST)]
+ROOK_EMPTY_ATTACKS = [POSITIVE_RAYS[0][square] | POSITIVE_RAYS[1][square] | NEGATIVE_RAYS[0][square] | NEGATIVE_RAYS[1][square] for square in range(64)]
+BISHOP_EMPTY_ATTACKS = [POSITIVE_RAYS[2][square] | POSITIVE_RAYS[3][square] | NEGATIVE_RAYS[2][square] | NEGATIVE_RAYS[3][square] for square in range(64)]
+
+def _between(start : int, end : int) -> int:
+    """Squares strictly between two squares on a shared rank, file or diagonal, empty if they are not aligned"""
+    for rays in POSITIVE_RAYS + NEGATIVE_RAYS:
+        if rays[start] >> end & 1:
+            return rays[start] & ~rays[end] & ~(1 << end)
+    return 0
+
+#BETWEEN[start][end]: squares strictly between the two squares, used for blocking checks and pin rays
+BETWEEN = [[_between(start, end) for end in range(64)] for start in range(64)]
+
+def _positive_ray_attacks(rays : list[int], square : int, occupied : int) -> int:
+    """Attacks along a ray towards higher squares, stopping at the first blocker"""
+    attacks = rays[square]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= rays[(blockers & -blockers).bit_length() - 1]
+    return attacks
+
+def _negative_ray_attacks(rays : list[int], square : int, occupied : int) -> int:
+    """Attacks along a ray towards lower squares, stopping at the first blocker"""
+    attacks = rays[square]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= rays[blockers.bit_length() - 1]
+    return attacks
+
+def rook_attacks(square : int, occupied : int) -> int:
+    """Returns the squares attacked by a rook on the square given the occupied squares"""
+    return _positive_ray_attacks(POSITIVE_RAYS[0], square, occupied) | _positive_ray_attacks(POSITIVE_RAYS[1], square, occupied) \
+        | _negative_ray_attacks(NEGATIVE_RAYS[0], square, occupied) | _negative_ray_attacks(NEGATIVE_RAYS[1], square, occupied)
+
+def bishop_attacks(square : int, occupied : int) -> int:
+    """Returns the squares attacked by a bishop on the square given the occupied squares"""
+    return _positive_ray_attacks(POSITIVE_RAYS[2], square, occupied) | _positive_ray_attacks(POSITIVE_RAYS[3], square, occupied) \
+        | _negative_ray_attacks(NEGATIVE_RAYS[2], square, occupied) | _negative_ray_attacks(NEGATIVE_RAYS[3], square, occupied)
+
+def queen_attacks(square : int, occupied : int) -> int:
+    """Returns the squares attacked by a queen on the square given the occupied squares"""
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
@@ -0,0 +1,79 @@
+"""Benchmarks how the engine's move latency scales with the number of worker processes, and what each selective search feature saves"""
+import argparse
+import time
+from board import Board, STARTING_FEN
+from engine import Engine, SEARCH_FEATURES
+from perft import REFERENCE_POSITIONS
+from models import move_to_uci
+from stats import SearchStats, profile_search
+
+def measure(fen : str, workers : int, depth : int, movetime_ms : int, repeats : int, stats : SearchStats = None) -> tuple:
+    """Searches the position with the given number of workers, returns (best move, average latency in seconds, nodes per search).
+    If stats is given it is filled in by the last search"""
+    board = Board(fen)
+    with Engine(board, 'W' if board.position.turn == 0 else 'B', workers=workers) as engine:
+        engine.search(depth=1) #start the worker processes before timing
+        engine.stats = stats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            move = engine.search(depth, movetime_ms)
+        latency = (time.perf_counter() - start) / repeats
+        return move, latency, engine.nodes
+
+def measure_features(depth : int, disabled : tuple[str, ...]) -> tuple[int, float]:
+    """Searches every reference position to the depth with some selective search features switched off,
+    returns the total nodes and time to depth in seconds"""
+    total_nodes = 0
+    total_time = 0.0
+    for _, fen, _ in REFERENCE_POSITIONS:
+        board = Board(fen)
+        engine = Engine(board, 'W' if board.position.turn == 0 else 'B')
+        for feature in disabled:
+            setattr(engine, feature, False)
+        start = time.perf_counter()
+        engine.search(depth)
+        total_time += time.perf_counter() - start
+        total_nodes += engine.nodes
+    return total_nodes, total_time
+
+def compare_features(depth : int):
+    """Prints the nodes and time to depth over the reference positions with every feature, none, and all but one"""
+    configurations = [("all features", ()), ("no features", SEARCH_FEATURES)] + [(f"without {feature}", (feature,)) for feature in SEARCH_FEATURES]
+    baseline = None
+    for name, disabled in configurations:
+        nodes, elapsed = measure_features(depth, disabled)
+        baseline = baseline or nodes
+        print(f"{name:<34} nodes {nodes:>9} ({nodes / baseline:.2f}x) time {elapsed:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure search latency against the number of worker processes")
+    parser.add_argument("--fen", default=STARTING_FEN, help="position to search, the starting position by default")
+    parser.add_argument("--depth", type=int, default=4, help="depth to search to")
+    parser.add_argument("--movetime", type=int, default=None, help="time limit per search in milliseconds instead of a fixed depth")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--repeats", type=int, default=1, help="searches to average over for each worker count")
+    parser.add_argument("--stats", action="store_true", help="print the search counters and phase times of each worker count as JSON")
+    parser.add_argument("--profile", action="store_true", help="profile a single search in this process instead of benchmarking")
+    parser.add_argument("--features", action="store_true", help="compare the selective search features on the perft reference positions")
+    args = parser.parse_args()
+    depth = None if args.movetime else args.depth
+
+    if args.features:
+        compare_features(args.depth)
+        return
+    if args.profile:
+        board = Board(args.fen)
+        move = profile_search(Engine(board, 'W' if board.position.turn == 0 else 'B'), depth, args.movetime)
+        print(f"move {move_to_uci(move.encode())}")
+        return
+    baseline = None
+    for workers in args.workers:
+        stats = SearchStats() if args.stats else None
+        move, latency, nodes = measure(args.fen, workers, depth, args.movetime, args.repeats, stats)
+        baseline = baseline or latency
+        print(f"workers {workers} move {move_to_uci(move.encode())} latency {latency:.3f}s nodes {nodes} speedup {baseline / latency:.2f}x")
+        if stats is not None:
+            print(stats.to_json())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Constants and helpers for working with 64-bit bitboards"""
+
+#Colors and piece types, used as indices into the position's bitboards
+WHITE = 0
+BLACK = 1
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+COLOR_NAMES = ('W', 'B')
+PIECE_CHARACTERS = ('P', 'N', 'B', 'R', 'Q', 'K')
+MATERIAL_VALUES = (1, 3, 3, 5, 9, 100)
+
+#Square 0 is a1 (rank 0, file 0), square 63 is h8 (rank 7, file 7)
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_G = FILE_A << 6
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_2 = RANK_1 << 8
+RANK_4 = RANK_1 << 24
+RANK_5 = RANK_1 << 32
+RANK_7 = RANK_1 << 48
+RANK_8 = RANK_1 << 56
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+NOT_FILE_AB = FULL ^ (FILE_A | FILE_B)
+NOT_FILE_GH = FULL ^ (FILE_G | FILE_H)
+
+#Sliding directions as (shift, mask applied after shifting to stop wrapping around the board)
+NORTH = (8, FULL)
+SOUTH = (-8, FULL)
+EAST = (1, NOT_FILE_A)
+WEST = (-1, NOT_FILE_H)
+NORTH_EAST = (9, NOT_FILE_A)
+NORTH_WEST = (7, NOT_FILE_H)
+SOUTH_EAST = (-7, NOT_FILE_A)
+SOUTH_WEST = (-9, NOT_FILE_H)
+ROOK_DIRECTIONS = (NORTH, SOUTH, EAST, WEST)
+BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+
+def color_index(color : str) -> int:
+    """Converts a color character ('W' or 'B') to an index"""
+    return WHITE if color == 'W' else BLACK
+
+def square_index(rank : int, file : int) -> int:
+    """Returns the index of the square at the given rank and file"""
+    return rank * 8 + file
+
+def square_bit(square : int) -> int:
+    """Returns a bitboard with only the given square set"""
+    return 1 << square
+
+def shift(bitboard : int, amount : int) -> int:
+    """Shifts a bitboard towards higher squares (positive) or lower squares (negative)"""
+    if amount > 0:
+        return (bitboard << amount) & FULL
+    return bitboard >> -amount
+
+def iterate_bits(bitboard : int):
+    """Yields the index of every set square, from lowest to highest"""
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+def lowest_square(bitboard : int) -> int:
+    """Returns the index of the lowest set square"""
+    return (bitboard & -bitboard).bit_length() - 1
+
+def popcount(bitboard : int) -> int:
+    """Returns the number of set squares"""
+    return bitboard.bit_count()
+
+def knight_attacks(bitboard : int) -> int:
+    """Returns all squares attacked by knights on the given squares"""
+    return (((bitboard << 17) & NOT_FILE_A) | ((bitboard << 15) & NOT_FILE_H)
+            | ((bitboard << 10) & NOT_FILE_AB) | ((bitboard << 6) & NOT_FILE_GH)
+            | ((bitboard >> 15) & NOT_FILE_A) | ((bitboard >> 17) & NOT_FILE_H)
+            | ((bitboard >> 6) & NOT_FILE_AB) | ((bitboard >> 10) & NOT_FILE_GH)) & FULL
+
+def king_attacks(bitboard : int) -> int:
+    """Returns all squares attacked by kings on the given squares"""
+    sideways = ((bitboard << 1) & NOT_FILE_A) | ((bitboard >> 1) & NOT_FILE_H)
+    row = bitboard | sideways
+    return (sideways | (row << 8) | (row >> 8)) & FULL
+
+def pawn_attacks(bitboard : int, color : int) -> int:
+    """Returns all squares attacked by pawns of the given color on the given squares"""
+    if color == WHITE:
+        return (((bitboard << 9) & NOT_FILE_A) | ((bitboard << 7) & NOT_FILE_H)) & FULL
+    return ((bitboard >> 7) & NOT_FILE_A) | ((bitboard >> 9) & NOT_FILE_H)
+
+def sliding_attacks(square : int, occupied : int, directions : tuple) -> int:
+    """Walks each direction from the square until the edge of the board or the first blocker"""
+    attacks = 0
+    for amount, mask in directions:
+        bitboard = 1 << square
+        while True:
+            bitboard = shift(bitboard, amount) & mask
+            if not bitboard:
+                break
+            attacks |= bitboard
+            if bitboard & occupied:
+                break
+    return attacks
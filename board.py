@@ -1,155 +1,541 @@
 """Module for the internal representation of the board"""
-import copy
-from pieces import Pawn, Knight, Bishop, Rook, Queen, King, NoPiece, piece_to_string, string_to_piece
-from models import Move
+import struct
+from bitboard import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_CHARACTERS, MATERIAL_VALUES, RANK_1, RANK_8, FULL, \
+    color_index, square_index, iterate_bits, lowest_square
+from attacks import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_EMPTY_ATTACKS, BISHOP_EMPTY_ATTACKS, BETWEEN, rook_attacks, bishop_attacks
+from pieces import PIECE_TYPES
+from evaluation import MIDDLEGAME_TABLES, ENDGAME_TABLES, PHASE_WEIGHTS, EXCHANGE_VALUES
+from zobrist import PIECE_KEYS, CASTLING_KEYS, EN_PASSANT_KEYS, BLACK_TO_MOVE_KEY
+from models import Move, CAPTURE
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+#Kinds of moves legal_moves can generate, noisy moves are captures and promotions
+NOISY_MOVES = 1
+QUIET_MOVES = 2
+ALL_MOVES = NOISY_MOVES | QUIET_MOVES
+
+#Packed positions are 32 bytes: the occupied squares as a 64-bit mask, a nibble (color << 3 | piece type) for each
+#occupied square in square order, the side to move and castling rights, the en passant square (255 if none),
+#the halfmove clock (capped at 255) and the fullmove number
+PACKED_POSITION = struct.Struct("<Q16sBBBH3x")
+NO_EN_PASSANT = 255
+
+#Castling rights, stored as bit flags
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+CASTLING_CHARACTERS = (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE), ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE))
+
+#Castling rights that survive a move touching a given square (the rook and king starting squares)
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[0] = 15 ^ WHITE_QUEENSIDE
+CASTLING_MASKS[4] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[7] = 15 ^ WHITE_KINGSIDE
+CASTLING_MASKS[56] = 15 ^ BLACK_QUEENSIDE
+CASTLING_MASKS[60] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[63] = 15 ^ BLACK_KINGSIDE
+
+#For each color: (castling right, king destination, squares that must be empty, squares the king must not be attacked on)
+CASTLING_PATHS = (
+    ((WHITE_KINGSIDE, 6, 0x60, (5, 6)), (WHITE_QUEENSIDE, 2, 0x0E, (3, 2))),
+    ((BLACK_KINGSIDE, 62, 0x60 << 56, (61, 62)), (BLACK_QUEENSIDE, 58, 0x0E << 56, (59, 58)))
+)
+#Rook (start, end) squares for each king destination when castling
+CASTLING_ROOK_SQUARES = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}
+
+def line_to_fen(line : str) -> str:
+    """Returns the FEN of a FEN or EPD line, EPD lines have no move counters and may end with operations like bm or id"""
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6])
+    return " ".join(fields[:4]) + " 0 1"
+
+class Position:
+    """Bitboard representation of a chess position: one bitboard per color and piece type, plus occupancy masks"""
+    def __init__(self, fen : str = STARTING_FEN):
+        self.set_fen(fen)
+
+    def clear(self):
+        """Remove every piece and reset the game state"""
+        self.bitboards = [[0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0]] #indexed by color, then piece type
+        self.occupancy = [0, 0] #all squares occupied by each color
+        self.occupied = 0
+        self.mailbox = [None] * 64 #(color, piece type) on each square, for fast lookups of a single square
+        self.turn = WHITE
+        self.castling = 0
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.key = 0 #Zobrist key, updated incrementally as pieces and game state change
+        self.pawn_key = 0 #Zobrist key of the pawns alone, for the pawn structure table
+        #evaluation terms, updated incrementally as pieces are placed and removed
+        self.material_balance = 0 #positive if white is ahead
+        self.middlegame_score = 0 #material and piece-square bonuses in centipawns, positive if white is ahead
+        self.endgame_score = 0
+        self.phase = 0 #sum of the phase weights of the pieces on the board, see evaluation.py
+        self.history = [] #undo records of every pushed move: (packed move, moved piece, captured piece, castling, en passant, halfmove clock, key)
+
+    def compute_key(self) -> int:
+        """Computes the Zobrist key of the position from scratch"""
+        key = CASTLING_KEYS[self.castling]
+        for square, piece in enumerate(self.mailbox):
+            if piece is not None:
+                key ^= PIECE_KEYS[piece[0]][piece[1]][square]
+        key ^= self.en_passant_key()
+        if self.turn == BLACK:
+            key ^= BLACK_TO_MOVE_KEY
+        return key
+
+    def en_passant_key(self) -> int:
+        """Zobrist key of the en passant square, only hashed when a pawn of the side to move attacks it (as in Polyglot),
+        so the same position reached with and without a useless double push has one key"""
+        if self.en_passant is None or not PAWN_ATTACKS[self.turn ^ 1][self.en_passant] & self.bitboards[self.turn][PAWN]:
+            return 0
+        return EN_PASSANT_KEYS[self.en_passant % 8]
+
+    def put_piece(self, square : int, color : int, piece_type : int):
+        """Place a piece on an empty square"""
+        bit = 1 << square
+        self.bitboards[color][piece_type] |= bit
+        self.occupancy[color] |= bit
+        self.occupied |= bit
+        self.mailbox[square] = (color, piece_type)
+        self.key ^= PIECE_KEYS[color][piece_type][square]
+        if piece_type == PAWN:
+            self.pawn_key ^= PIECE_KEYS[color][PAWN][square]
+        self.material_balance += MATERIAL_VALUES[piece_type] if color == WHITE else -MATERIAL_VALUES[piece_type]
+        self.middlegame_score += MIDDLEGAME_TABLES[color][piece_type][square]
+        self.endgame_score += ENDGAME_TABLES[color][piece_type][square]
+        self.phase += PHASE_WEIGHTS[piece_type]
+
+    def remove_piece(self, square : int):
+        """Remove the piece on the given square, returns it as (color, piece type)"""
+        piece = self.mailbox[square]
+        if piece is not None:
+            color, piece_type = piece
+            bit = 1 << square
+            self.bitboards[color][piece_type] ^= bit
+            self.occupancy[color] ^= bit
+            self.occupied ^= bit
+            self.mailbox[square] = None
+            self.key ^= PIECE_KEYS[color][piece_type][square]
+            if piece_type == PAWN:
+                self.pawn_key ^= PIECE_KEYS[color][PAWN][square]
+            self.material_balance -= MATERIAL_VALUES[piece_type] if color == WHITE else -MATERIAL_VALUES[piece_type]
+            self.middlegame_score -= MIDDLEGAME_TABLES[color][piece_type][square]
+            self.endgame_score -= ENDGAME_TABLES[color][piece_type][square]
+            self.phase -= PHASE_WEIGHTS[piece_type]
+        return piece
+
+    def push(self, move : int):
+        """Play a packed move, recording what is needed to undo it"""
+        start = move & 63
+        end = move >> 6 & 63
+        piece = self.mailbox[start]
+        captured = self.mailbox[end]
+        color, piece_type = piece
+        en_passant_capture = piece_type == PAWN and end == self.en_passant
+        if en_passant_capture: #the captured pawn is behind the end square
+            captured = self.mailbox[end - 8 if color == WHITE else end + 8]
+        self.history.append((move, piece, captured, self.castling, self.en_passant, self.halfmove_clock, self.key))
+        self.key ^= CASTLING_KEYS[self.castling] ^ self.en_passant_key() #before any pawn moves
+        if en_passant_capture: #removed only once the undo record holds the key from before the move
+            self.remove_piece(end - 8 if color == WHITE else end + 8)
+
+        self.remove_piece(start)
+        if self.mailbox[end] is not None:
+            self.remove_piece(end)
+        if piece_type == PAWN and (1 << end) & (RANK_1 | RANK_8):
+            piece_type = move >> 12 & 7 or QUEEN #promote to a queen unless another piece is specified
+        elif piece_type == KING and abs(end - start) == 2: #castling, bring the rook over the king
+            rook_start, rook_end = CASTLING_ROOK_SQUARES[end]
+            self.remove_piece(rook_start)
+            self.put_piece(rook_end, color, ROOK)
+        self.put_piece(end, color, piece_type)
+
+        self.castling &= CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        self.en_passant = (start + end) // 2 if piece_type == PAWN and abs(end - start) == 16 else None
+        self.halfmove_clock = 0 if piece_type == PAWN or captured is not None else self.halfmove_clock + 1
+        if color == BLACK:
+            self.fullmove_number += 1
+        if self.turn == color:
+            self.key ^= BLACK_TO_MOVE_KEY
+        self.turn = color ^ 1
+        self.key ^= CASTLING_KEYS[self.castling] ^ self.en_passant_key()
+
+    def push_null(self):
+        """Pass the turn to the other side without moving, for null-move pruning, undone with pop"""
+        self.history.append((0, None, None, self.castling, self.en_passant, self.halfmove_clock, self.key))
+        self.key ^= self.en_passant_key()
+        self.en_passant = None
+        self.halfmove_clock += 1
+        self.key ^= BLACK_TO_MOVE_KEY
+        self.turn ^= 1
+
+    def pop(self) -> int:
+        """Undo the last pushed move, returns it"""
+        move, piece, captured, self.castling, self.en_passant, self.halfmove_clock, key = self.history.pop()
+        if piece is None: #a null move
+            self.turn ^= 1
+            self.key = key
+            return move
+        start = move & 63
+        end = move >> 6 & 63
+        color, piece_type = piece
+        self.remove_piece(end)
+        self.put_piece(start, color, piece_type)
+        if piece_type == KING and abs(end - start) == 2:
+            rook_start, rook_end = CASTLING_ROOK_SQUARES[end]
+            self.remove_piece(rook_end)
+            self.put_piece(rook_start, color, ROOK)
+        if captured is not None:
+            if piece_type == PAWN and end == self.en_passant:
+                self.put_piece(end - 8 if color == WHITE else end + 8, *captured)
+            else:
+                self.put_piece(end, *captured)
+        if color == BLACK:
+            self.fullmove_number -= 1
+        self.turn = color
+        self.key = key
+        return move
+
+    def attackers(self, square : int, color : int, occupied : int = None) -> int:
+        """Returns a bitboard of every piece of the given color attacking the square, optionally with a different occupancy"""
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.bitboards[color]
+        attackers = (KNIGHT_ATTACKS[square] & pieces[KNIGHT]) | (KING_ATTACKS[square] & pieces[KING]) \
+            | (PAWN_ATTACKS[color ^ 1][square] & pieces[PAWN])
+        diagonal = (pieces[BISHOP] | pieces[QUEEN]) & BISHOP_EMPTY_ATTACKS[square]
+        if diagonal:
+            attackers |= bishop_attacks(square, occupied) & diagonal
+        straight = (pieces[ROOK] | pieces[QUEEN]) & ROOK_EMPTY_ATTACKS[square]
+        if straight:
+            attackers |= rook_attacks(square, occupied) & straight
+        return attackers
+
+    def static_exchange(self, move : int) -> int:
+        """Material won or lost by the capture sequence the move starts on its end square, both sides recapturing with their
+        least valuable attacker and free to stop at any point. Works from attack lookups without making any moves"""
+        start = move & 63
+        end = move >> 6 & 63
+        color = self.mailbox[start][0]
+        victim = self.mailbox[end]
+        occupied = self.occupied ^ (1 << start)
+        if victim is None and self.mailbox[start][1] == PAWN and end == self.en_passant:
+            victim = (color ^ 1, PAWN)
+            occupied ^= 1 << (end - 8 if color == WHITE else end + 8)
+        gains = [0 if victim is None else EXCHANGE_VALUES[victim[1]]]
+        on_square = EXCHANGE_VALUES[self.mailbox[start][1]] #value of the piece standing on the square, the next to be captured
+        promotion = move >> 12 & 7
+        if promotion:
+            gains[0] += EXCHANGE_VALUES[promotion] - EXCHANGE_VALUES[PAWN]
+            on_square = EXCHANGE_VALUES[promotion]
+        side = color ^ 1
+        while True:
+            attackers = self.attackers(end, side, occupied) & occupied #recomputed so sliders behind a capturer join in
+            if not attackers:
+                break
+            for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+                candidates = attackers & self.bitboards[side][piece_type]
+                if candidates:
+                    break
+            bit = candidates & -candidates
+            if piece_type == KING and self.attackers(end, side ^ 1, occupied ^ bit) & (occupied ^ bit):
+                break #the king cannot capture into a defended square
+            gains.append(on_square - gains[-1])
+            on_square = EXCHANGE_VALUES[piece_type]
+            occupied ^= bit
+            side ^= 1
+        while len(gains) > 1: #each side only continues the sequence while it gains from doing so
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    def in_check(self, color : int) -> bool:
+        """Check if the king of the given color is attacked"""
+        king = self.bitboards[color][KING]
+        if not king:
+            return False
+        return self.attackers(lowest_square(king), color ^ 1) != 0
+
+    def piece_attacks(self, square : int, color : int, piece_type : int) -> int:
+        """Returns the squares attacked by a piece of the given type standing on the square"""
+        return PIECE_TYPES[piece_type].attacks(square, self.occupied, color)
+
+    def pins(self, color : int, king_square : int) -> dict:
+        """Returns the pinned pieces of the given color, mapped to the squares they may still move to (the pin ray and the pinner)"""
+        enemy = self.bitboards[color ^ 1]
+        snipers = (ROOK_EMPTY_ATTACKS[king_square] & (enemy[ROOK] | enemy[QUEEN])) \
+            | (BISHOP_EMPTY_ATTACKS[king_square] & (enemy[BISHOP] | enemy[QUEEN]))
+        pins = {}
+        for sniper in iterate_bits(snipers):
+            blockers = BETWEEN[king_square][sniper] & self.occupied
+            if blockers and not blockers & (blockers - 1) and blockers & self.occupancy[color]:
+                pins[lowest_square(blockers)] = BETWEEN[king_square][sniper] | (1 << sniper)
+        return pins
+
+    def legal_moves(self, color : int, kind : int = ALL_MOVES, sources : int = FULL):
+        """Yields the legal moves of the given color as packed 16-bit moves. kind selects noisy moves (captures and promotions),
+        quiet moves or both, sources optionally limits the squares the moves start from"""
+        pieces = self.bitboards[color]
+        if not pieces[KING]:
+            return
+        king_square = lowest_square(pieces[KING])
+        own = self.occupancy[color]
+        enemy = self.occupancy[color ^ 1]
+        empty = ~self.occupied & FULL
+        destinations = (enemy if kind & NOISY_MOVES else 0) | (empty if kind & QUIET_MOVES else 0)
+
+        #King moves: the destination must not be attacked once the king has left its square
+        if pieces[KING] & sources:
+            occupied_without_king = self.occupied ^ pieces[KING]
+            for target in iterate_bits(KING_ATTACKS[king_square] & destinations):
+                if not self.attackers(target, color ^ 1, occupied_without_king):
+                    yield king_square | target << 6 | (CAPTURE if enemy >> target & 1 else 0)
+
+        checkers = self.attackers(king_square, color ^ 1)
+        if checkers & (checkers - 1): #double check, only the king can move
+            return
+        pins = self.pins(color, king_square)
+        if checkers:
+            evasions = checkers | BETWEEN[king_square][lowest_square(checkers)] #capture the checker or block its ray
+        else:
+            evasions = FULL
+            if kind & QUIET_MOVES and pieces[KING] & sources:
+                yield from self.castling_moves(color, king_square)
+
+        #Pawns: single and double pushes onto empty squares, diagonal captures onto enemy pieces, every promotion is noisy
+        forward = 8 if color == WHITE else -8
+        starting_rank = 1 if color == WHITE else 6
+        pushes = (empty & ~(RANK_1 | RANK_8) if kind & QUIET_MOVES else 0) | (empty & (RANK_1 | RANK_8) if kind & NOISY_MOVES else 0)
+        for square in iterate_bits(pieces[PAWN] & sources):
+            allowed = evasions & pins.get(square, FULL)
+            targets = 0
+            target = square + forward
+            if (1 << target) & empty:
+                targets |= 1 << target
+                if square // 8 == starting_rank and (1 << (target + forward)) & empty:
+                    targets |= 1 << (target + forward)
+            targets &= pushes
+            if kind & NOISY_MOVES:
+                targets |= PAWN_ATTACKS[color][square] & enemy
+            for target in iterate_bits(targets & allowed):
+                move = square | target << 6 | (CAPTURE if enemy >> target & 1 else 0)
+                if (1 << target) & (RANK_1 | RANK_8):
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        yield move | promotion << 12
+                else:
+                    yield move
+            if self.en_passant is not None and kind & NOISY_MOVES and color == self.turn \
+                    and PAWN_ATTACKS[color][square] >> self.en_passant & 1:
+                if self.is_legal_en_passant(square, color, king_square):
+                    yield square | self.en_passant << 6 | CAPTURE
+
+        #Every other piece: attacked squares not occupied by our own pieces, kept on the pin ray and resolving any check
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN):
+            for square in iterate_bits(pieces[piece_type] & sources):
+                targets = self.piece_attacks(square, color, piece_type) & evasions & pins.get(square, FULL) & destinations
+                for target in iterate_bits(targets & enemy):
+                    yield square | target << 6 | CAPTURE
+                for target in iterate_bits(targets & empty):
+                    yield square | target << 6
+
+    def castling_moves(self, color : int, king_square : int):
+        """Yields the castling moves available to the given color, which must not be in check"""
+        for flag, end, path, king_path in CASTLING_PATHS[color]:
+            if self.castling & flag and not self.occupied & path \
+                    and not any(self.attackers(square, color ^ 1) for square in king_path):
+                yield king_square | end << 6
+
+    def is_legal_en_passant(self, square : int, color : int, king_square : int) -> bool:
+        """Check if capturing en passant with the pawn on the square leaves the king safe, both pawns leave their squares at once"""
+        captured = self.en_passant - 8 if color == WHITE else self.en_passant + 8
+        occupied = self.occupied ^ (1 << square) ^ (1 << captured) | (1 << self.en_passant)
+        return not self.attackers(king_square, color ^ 1, occupied) & ~(1 << captured)
+
+    def material(self) -> int:
+        """Returns the material balance, positive if white is ahead"""
+        return self.material_balance
+
+    def piece_character(self, square : int) -> str:
+        """Returns the FEN character of the piece on the square, or '-' if it is empty"""
+        piece = self.mailbox[square]
+        if piece is None:
+            return '-'
+        color, piece_type = piece
+        return PIECE_CHARACTERS[piece_type] if color == WHITE else PIECE_CHARACTERS[piece_type].lower()
+
+    def set_fen(self, fen : str):
+        """Set the position from standard FEN notation, missing fields fall back to their defaults"""
+        self.clear()
+        fields = fen.split()
+        rank_num = 7 #FEN starts from the eighth rank
+        file_num = 0
+        for char in fields[0]:
+            if char == '/':
+                rank_num -= 1
+                file_num = 0
+            elif char.isdigit():
+                file_num += int(char)
+            else:
+                if char.upper() not in PIECE_CHARACTERS or not (0 <= rank_num < 8 and 0 <= file_num < 8):
+                    raise ValueError(f"Invalid FEN: {fen}")
+                color = WHITE if char.isupper() else BLACK
+                self.put_piece(square_index(rank_num, file_num), color, PIECE_CHARACTERS.index(char.upper()))
+                file_num += 1
+        if len(fields) > 1:
+            self.turn = WHITE if fields[1] == 'w' else BLACK
+        if len(fields) > 2:
+            for char, flag in CASTLING_CHARACTERS:
+                if char in fields[2]:
+                    self.castling |= flag
+        if len(fields) > 3 and fields[3] != '-':
+            self.en_passant = square_index(int(fields[3][1]) - 1, ord(fields[3][0]) - ord('a'))
+        if len(fields) > 5:
+            self.halfmove_clock = int(fields[4])
+            self.fullmove_number = int(fields[5])
+        self.key = self.compute_key()
+
+    def pack(self) -> bytes:
+        """Returns the position in the fixed-size packed format, see PACKED_POSITION"""
+        if self.occupied.bit_count() > 32:
+            raise ValueError("Too many pieces to pack")
+        nibbles = bytearray(16)
+        mailbox = self.mailbox
+        for index, square in enumerate(iterate_bits(self.occupied)):
+            color, piece_type = mailbox[square]
+            nibbles[index >> 1] |= (color << 3 | piece_type) << (index & 1) * 4
+        return PACKED_POSITION.pack(self.occupied, bytes(nibbles), self.turn | self.castling << 1,
+                                    NO_EN_PASSANT if self.en_passant is None else self.en_passant,
+                                    min(self.halfmove_clock, 255), self.fullmove_number)
+
+    def set_packed(self, data, offset : int = 0):
+        """Set the position from the packed format, read from any buffer (bytes, mmap, ...) at the given offset"""
+        occupied, nibbles, state, en_passant, halfmove_clock, fullmove_number = PACKED_POSITION.unpack_from(data, offset)
+        self.clear()
+        for index, square in enumerate(iterate_bits(occupied)):
+            code = nibbles[index >> 1] >> (index & 1) * 4 & 15
+            if code & 7 > KING:
+                raise ValueError(f"Invalid packed piece {code}")
+            self.put_piece(square, code >> 3, code & 7)
+        self.turn = state & 1
+        self.castling = state >> 1 & 15
+        self.en_passant = None if en_passant == NO_EN_PASSANT else en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.key = self.compute_key()
+
+    @classmethod
+    def from_packed(cls, data, offset : int = 0):
+        """Builds a position from the packed format, without going through FEN"""
+        position = cls.__new__(cls)
+        position.set_packed(data, offset)
+        return position
+
+    def fen(self) -> str:
+        """Returns the position in standard FEN notation"""
+        rows = []
+        for rank_num in range(7, -1, -1):
+            row = ""
+            counter = 0 #number of empty squares in a row
+            for file_num in range(8):
+                piece = self.piece_character(square_index(rank_num, file_num))
+                if piece == '-':
+                    counter += 1
+                else:
+                    if counter != 0:
+                        row += str(counter)
+                        counter = 0
+                    row += piece
+            if counter != 0:
+                row += str(counter)
+            rows.append(row)
+        castling = "".join(char for char, flag in CASTLING_CHARACTERS if self.castling & flag) or '-'
+        en_passant = '-' if self.en_passant is None else "abcdefgh"[self.en_passant % 8] + str(self.en_passant // 8 + 1)
+        return f"{'/'.join(rows)} {'w' if self.turn == WHITE else 'b'} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
 
 class Board:
     """Model class for the chessboard"""
     def __init__(self, fen : str = None):
         if fen is None: #if a position is not specified, set to the starting position
-            self.board = [[Rook(0, 0, 'W'), Knight(0, 1, 'W'), Bishop(0, 2, 'W'), Queen(0, 3, 'W'), King(0, 4, 'W'), Bishop(0, 5, 'W'), Knight(0, 6, 'W'), Rook(0, 7, 'W')],
-                          [Pawn(1, 0, 'W'), Pawn(1, 1, 'W'), Pawn(1, 2, 'W'), Pawn(1, 3, 'W'), Pawn(1, 4, 'W'), Pawn(1, 5, 'W'), Pawn(1, 6, 'W'), Pawn(1, 7, 'W')],
-                          [NoPiece(2, 0, 'N'), NoPiece(2, 1, 'N'), NoPiece(2, 2, 'N'), NoPiece(2, 3, 'N'), NoPiece(2, 4, 'N'), NoPiece(2, 5, 'N'), NoPiece(2, 6, 'N'), NoPiece(2, 7, 'N')],
-                          [NoPiece(3, 0, 'N'), NoPiece(3, 1, 'N'), NoPiece(3, 2, 'N'), NoPiece(3, 3, 'N'), NoPiece(3, 4, 'N'), NoPiece(3, 5, 'N'), NoPiece(3, 6, 'N'), NoPiece(3, 7, 'N')],
-                          [NoPiece(4, 0, 'N'), NoPiece(4, 1, 'N'), NoPiece(4, 2, 'N'), NoPiece(4, 3, 'N'), NoPiece(4, 4, 'N'), NoPiece(4, 5, 'N'), NoPiece(4, 6, 'N'), NoPiece(4, 7, 'N')],
-                          [NoPiece(5, 0, 'N'), NoPiece(5, 1, 'N'), NoPiece(5, 2, 'N'), NoPiece(5, 3, 'N'), NoPiece(5, 4, 'N'), NoPiece(5, 5, 'N'), NoPiece(5, 6, 'N'), NoPiece(5, 7, 'N')],
-                          [Pawn(6, 0, 'B'), Pawn(6, 1, 'B'), Pawn(6, 2, 'B'), Pawn(6, 3, 'B'), Pawn(6, 4, 'B'), Pawn(6, 5, 'B'), Pawn(6, 6, 'B'), Pawn(6, 7, 'B')],
-                          [Rook(7, 0, 'B'), Knight(7, 1, 'B'), Bishop(7, 2, 'B'), Queen(7, 3, 'B'), King(7, 4, 'B'), Bishop(7, 5, 'B'), Knight(7, 6, 'B'), Rook(7, 7, 'B')]
-                        ]
+            self.position = Position()
         else: #if a FEN is provided, set the board to it
+            self.position = Position()
             self.fen_to_board(fen)
 
     def make_move(self, move : Move):
         """Make a move on the board"""
-        try:
-            self.board[move.endsquare.rank][move.endsquare.file] = self.board[move.startsquare.rank][move.startsquare.file]
-            self.board[move.endsquare.rank][move.endsquare.file].square = move.endsquare
-            self.board[move.startsquare.rank][move.startsquare.file] = NoPiece(move.startsquare.rank, move.startsquare.file, 'N')
-            if isinstance(self.board[move.endsquare.rank][move.endsquare.file], Pawn): #auto queen
-                if move.endsquare.rank == 7:
-                    self.board[move.endsquare.rank][move.endsquare.file] = Queen(move.endsquare.rank, move.endsquare.file, 'W')
-                elif move.endsquare.rank == 0:
-                    self.board[move.endsquare.rank][move.endsquare.file] = Queen(move.endsquare.rank, move.endsquare.file, 'B')
-        except IndexError: #moves can also be logically invalid, but this is checked at move generation
+        self.push(move)
+
+    def find_legal_move(self, move : Move, color : int) -> int:
+        """Returns the packed legal move of the given color matching the move, or None if it is not legal.
+        A pawn reaching the last rank promotes to a queen unless another piece is given"""
+        squares = (move.startsquare.rank, move.startsquare.file, move.endsquare.rank, move.endsquare.file)
+        if not all(0 <= coordinate < 8 for coordinate in squares):
+            return None
+        packed = move.encode()
+        legal = {legal_move & ~CAPTURE: legal_move for legal_move in self.position.legal_moves(color)}
+        if packed not in legal and not move.promotion:
+            packed |= QUEEN << 12
+        return legal.get(packed)
+
+    def push(self, move : Move) -> bool:
+        """Make a move on the board, it can be taken back with pop. Returns False, without playing it, if the move
+        is not legal for the side to move"""
+        packed = self.find_legal_move(move, self.position.turn)
+        if packed is None:
             print("Invalid move")
+            return False
+        self.position.push(packed)
+        return True
+
+    def pop(self) -> Move:
+        """Take back the last move made on the board, returns it"""
+        return Move.decode(self.position.pop())
+
+    def legal_moves(self, color : str):
+        """Yields every legal move for the given color"""
+        for move in self.position.legal_moves(color_index(color)):
+            yield Move.decode(move)
 
     def is_legal_move(self, move : Move, color : str) -> bool:
         """Check if the given move is legal (ie, does not leave the king in check)"""
-        restore_piece = copy.deepcopy(self.board[move.endsquare.rank][move.endsquare.file])
-        self.make_move(move)
-        if not self.is_in_check(color):
-            self.make_move(Move(move.endsquare, move.startsquare)) #restore the board
-            self.board[move.endsquare.rank][move.endsquare.file] = restore_piece
-            return True
-        self.make_move(Move(move.endsquare, move.startsquare)) #restore the board
-        self.board[move.endsquare.rank][move.endsquare.file] = restore_piece
-        return False
+        return self.find_legal_move(move, color_index(color)) is not None
 
     def is_in_check(self, color : str) -> bool:
         """Check if the given color is in check"""
-        #locate king
-        for row in self.board:
-            for piece in row:
-                if isinstance(piece, King) and piece.color == color:
-                    king = piece
-                    #check if any enemy pieces can attack the king
-                    for row in self.board:
-                        for piece in row:
-                            if piece.color != 'N' and piece.color != color:
-                                for move in piece.generate_moves(self.board_to_characters()):
-                                    if move.endsquare == king.square:
-                                        return True
-                    return False
+        return self.position.in_check(color_index(color))
 
     def is_in_checkmate(self, color : str) -> bool:
         """Check if the given color is in checkmate"""
-        if self.is_in_check(color):
-            for row in self.board:
-                for piece in row:
-                    if piece.color == color:
-                        for move in piece.generate_moves(self.board_to_characters()):
-                            if self.is_legal_move(move, color):
-                                return False
-            return True
-        else:
-            return False
+        return self.is_in_check(color) and next(self.position.legal_moves(color_index(color)), None) is None
 
     def is_in_stalemate(self, color : str) -> bool:
         """Check if the given color is in stalemate"""
-        if not self.is_in_check(color):
-            for row in self.board:
-                for piece in row:
-                    if piece.color == color:
-                        for move in piece.generate_moves(self.board_to_characters()):
-                            if self.is_legal_move(move, color):
-                                return False
-            return True
-        else:
-            return False
+        return not self.is_in_check(color) and next(self.position.legal_moves(color_index(color)), None) is None
 
     def board_to_characters(self):
         """Board as an array of strings"""
-        board = [['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-'],
-                 ['-', '-', '-', '-', '-', '-', '-', '-']]
-        rank_num = 0
-        file_num = 0
-        for row in self.board:
-            for piece in row:
-                board[rank_num][file_num] = piece_to_string(piece)
-                file_num += 1
-            file_num = 0
-            rank_num += 1
-        return board
+        return [[self.position.piece_character(square_index(rank_num, file_num)) for file_num in range(8)] for rank_num in range(8)]
 
     def board_to_fen(self):
         """Board as standard FEN notation"""
-        fen = ""
-        counter = 0 #number of pieces in a row
-        board_as_characters = reversed(self.board_to_characters()) #to fit with chess coordinates, the board is stored in reverse
-        for row in board_as_characters:
-            for piece in row:
-                if piece == '-':
-                    counter += 1
-                else:
-                    if counter != 0:
-                        fen += str(counter)
-                        counter = 0
-                    fen += piece
-            if counter != 0:
-                fen += str(counter)
-                counter = 0
-            fen += '/'
-        return fen
+        return self.position.fen()
+
+    def board_to_packed(self) -> bytes:
+        """Board in the 32-byte packed format"""
+        return self.position.pack()
+
+    def packed_to_board(self, data, offset : int = 0):
+        """Set a position from the 32-byte packed format"""
+        self.position.set_packed(data, offset)
 
     def fen_to_board(self, fen : str):
         """Set a position using standard FEN notation"""
-        self.board = [[NoPiece(0, 0, 'N'), NoPiece(0, 1, 'N'), NoPiece(0, 2, 'N'), NoPiece(0, 3, 'N'), NoPiece(0, 4, 'N'), NoPiece(0, 5, 'N'), NoPiece(0, 6, 'N'), NoPiece(0, 7, 'N')],
-                      [NoPiece(1, 0, 'N'), NoPiece(1, 1, 'N'), NoPiece(1, 2, 'N'), NoPiece(1, 3, 'N'), NoPiece(1, 4, 'N'), NoPiece(1, 5, 'N'), NoPiece(1, 6, 'N'), NoPiece(1, 7, 'N')],
-                      [NoPiece(2, 0, 'N'), NoPiece(2, 1, 'N'), NoPiece(2, 2, 'N'), NoPiece(2, 3, 'N'), NoPiece(2, 4, 'N'), NoPiece(2, 5, 'N'), NoPiece(2, 6, 'N'), NoPiece(2, 7, 'N')],
-                      [NoPiece(3, 0, 'N'), NoPiece(3, 1, 'N'), NoPiece(3, 2, 'N'), NoPiece(3, 3, 'N'), NoPiece(3, 4, 'N'), NoPiece(3, 5, 'N'), NoPiece(3, 6, 'N'), NoPiece(3, 7, 'N')],
-                      [NoPiece(4, 0, 'N'), NoPiece(4, 1, 'N'), NoPiece(4, 2, 'N'), NoPiece(4, 3, 'N'), NoPiece(4, 4, 'N'), NoPiece(4, 5, 'N'), NoPiece(4, 6, 'N'), NoPiece(4, 7, 'N')],
-                      [NoPiece(5, 0, 'N'), NoPiece(5, 1, 'N'), NoPiece(5, 2, 'N'), NoPiece(5, 3, 'N'), NoPiece(5, 4, 'N'), NoPiece(5, 5, 'N'), NoPiece(5, 6, 'N'), NoPiece(5, 7, 'N')],
-                      [NoPiece(6, 0, 'N'), NoPiece(6, 1, 'N'), NoPiece(6, 2, 'N'), NoPiece(6, 3, 'N'), NoPiece(6, 4, 'N'), NoPiece(6, 5, 'N'), NoPiece(6, 6, 'N'), NoPiece(6, 7, 'N')],
-                      [NoPiece(7, 0, 'N'), NoPiece(7, 1, 'N'), NoPiece(7, 2, 'N'), NoPiece(7, 3, 'N'), NoPiece(7, 4, 'N'), NoPiece(7, 5, 'N'), NoPiece(7, 6, 'N'), NoPiece(7, 7, 'N')],
-                    ]
-        rank_num = 7 #reverse, to fit with chess coordinates
-        file_num = 0
-        for char in fen:
-            if char == '/':
-                rank_num -= 1
-                file_num = 0
-            elif char.isdigit():
-                file_num += int(char)
-            else:
-                try:
-                    self.board[rank_num][file_num] = string_to_piece(char, rank_num, file_num)
-                    file_num += 1
-                except IndexError:
-                    print("Invalid FEN")
-                    return
+        try:
+            self.position.set_fen(fen)
+        except (ValueError, IndexError):
+            print("Invalid FEN")
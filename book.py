@@ -0,0 +1,188 @@
+"""Opening book: a sorted file of fixed-size records keyed by position hash, probed through mmap with a binary search"""
+import argparse
+import mmap
+import os
+import re
+import struct
+from board import Position, STARTING_FEN
+from bitboard import PAWN, KING, PIECE_CHARACTERS
+from models import CAPTURE, move_to_uci
+
+#Each record is a Zobrist key, a packed move (without the capture flag) and a weight, big-endian so records sort by key
+RECORD = struct.Struct(">QHH")
+MAX_WEIGHT = 0xFFFF
+DEFAULT_MAX_PLY = 24
+
+class OpeningBook:
+    """Read-only view of a book file, many processes opening the same file share its pages in the page cache"""
+    def __init__(self, path : str):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.records = size // RECORD.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        """Closes the mapping and the file"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def entries(self, key : int) -> list[tuple[int, int]]:
+        """Returns the (packed move, weight) entries stored for the position key"""
+        low = 0
+        high = self.records
+        while low < high: #find the first record with this key
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self.data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.records:
+            record_key, move, weight = RECORD.unpack_from(self.data, low * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+    def probe(self, position : Position) -> int:
+        """Returns the legal move with the highest weight for the position (with its capture flag), or None if it is not in the book"""
+        legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+        for move, _ in sorted(self.entries(position.key), key=lambda entry: -entry[1]):
+            if move in legal:
+                return legal[move]
+        return None
+
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+def san_to_move(position : Position, san : str) -> int:
+    """Finds the legal move written in standard algebraic notation, e.g. Nf3, exd5, O-O or e8=Q, returns None if there is none"""
+    san = san.rstrip("+#!?")
+    moves = list(position.legal_moves(position.turn))
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        offset = 2 if len(san) == 3 else -2
+        for move in moves:
+            start = move & 63
+            if position.mailbox[start][1] == KING and (move >> 6 & 63) - start == offset:
+                return move
+        return None
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        return None
+    piece, from_file, from_rank, target, promotion = match.groups()
+    piece_type = PIECE_CHARACTERS.index(piece) if piece else PAWN
+    end = (int(target[1]) - 1) * 8 + "abcdefgh".index(target[0])
+    promotion_type = PIECE_CHARACTERS.index(promotion) if promotion else 0
+    for move in moves:
+        start = move & 63
+        if move >> 6 & 63 != end or position.mailbox[start][1] != piece_type or move >> 12 & 7 != promotion_type:
+            continue
+        if from_file and "abcdefgh"[start % 8] != from_file or from_rank and str(start // 8 + 1) != from_rank:
+            continue
+        return move
+    return None
+
+PGN_NOISE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?|1-0|0-1|1/2-1/2|\*")
+
+def read_pgn_games(lines):
+    """Yields the list of SAN moves of every game in a PGN stream, comments, variations and annotations are skipped"""
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            if movetext:
+                yield parse_movetext(" ".join(movetext))
+                movetext = []
+        elif line:
+            movetext.append(line)
+    if movetext:
+        yield parse_movetext(" ".join(movetext))
+
+def parse_movetext(text : str) -> list[str]:
+    """Returns the main line SAN moves of a game's movetext"""
+    text = PGN_NOISE.sub(" ", text)
+    depth = 0 #nesting of variations, which are dropped
+    main_line = []
+    for character in text:
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif depth == 0:
+            main_line.append(character)
+    return "".join(main_line).split()
+
+def count_pgn(lines, counts : dict, max_ply : int = DEFAULT_MAX_PLY):
+    """Adds the first max_ply moves of every game to the (key, move) counts"""
+    for game in read_pgn_games(lines):
+        position = Position(STARTING_FEN)
+        for san in game[:max_ply]:
+            move = san_to_move(position, san)
+            if move is None: #stop at the first move that cannot be read
+                break
+            entry = (position.key, move & ~CAPTURE)
+            counts[entry] = counts.get(entry, 0) + 1
+            position.push(move)
+
+def count_epd(lines, counts : dict):
+    """Adds the best move (bm operation) of every EPD line to the (key, move) counts"""
+    for line in lines:
+        fields = line.split(maxsplit=4)
+        if len(fields) < 5 or "bm " not in fields[4]:
+            continue
+        try:
+            position = Position(" ".join(fields[:4]) + " 0 1")
+        except (ValueError, IndexError):
+            continue
+        for operation in fields[4].split(';'):
+            operation = operation.strip()
+            if operation.startswith("bm "):
+                for san in operation[3:].split():
+                    move = san_to_move(position, san)
+                    if move is not None:
+                        entry = (position.key, move & ~CAPTURE)
+                        counts[entry] = counts.get(entry, 0) + 1
+
+def write_book(counts : dict, path : str):
+    """Writes the counted moves as book records sorted by key, most played moves first within a key"""
+    with open(path, 'wb') as file:
+        for (key, move), count in sorted(counts.items(), key=lambda item: (item[0][0], -item[1])):
+            file.write(RECORD.pack(key, move, min(count, MAX_WEIGHT)))
+
+def build_book(sources : list[str], path : str, max_ply : int = DEFAULT_MAX_PLY) -> int:
+    """Compiles PGN and EPD files (told apart by extension) into a book file, returns the number of records"""
+    counts = {}
+    for source in sources:
+        with open(source) as file:
+            if source.lower().endswith((".epd", ".fen")):
+                count_epd(file, counts)
+            else:
+                count_pgn(file, counts, max_ply)
+    write_book(counts, path)
+    return len(counts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book from PGN or EPD files, or look up a position in one")
+    parser.add_argument("book", help="book file to write or read")
+    parser.add_argument("sources", nargs='*', help="PGN or EPD files to build the book from")
+    parser.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="number of moves of each game to add")
+    parser.add_argument("--probe", default=None, help="FEN of a position to look up instead of building")
+    args = parser.parse_args()
+
+    if args.probe:
+        with OpeningBook(args.book) as book:
+            position = Position(args.probe)
+            for move, weight in book.entries(position.key):
+                print(f"{move_to_uci(move)} {weight}")
+    else:
+        print(f"{build_book(args.sources, args.book, args.max_ply)} records written to {args.book}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Persistent analysis cache: search results keyed by position hash in a sqlite file shared by every engine process"""
+import argparse
+import sqlite3
+import threading
+import time
+from board import Position
+from models import CAPTURE, move_to_uci
+
+DEFAULT_MAX_ENTRIES = 1000000
+DEFAULT_BATCH_SIZE = 64 #writes held in memory before they are committed together
+FLUSH_INTERVAL = 10.0 #seconds a write may wait for its batch to fill
+DEFAULT_MIN_DEPTH = 8 #shallowest result answered from the cache when a search has no depth limit
+DEPTH_AGE = 3600 #seconds of idleness each ply of depth is worth when choosing entries to evict
+EVICTION_FRACTION = 0.9 #an overfull cache is trimmed to this fraction of its cap, so evictions are rare
+
+#Keys are stored as signed integers, sqlite has no unsigned 64-bit type
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS analysis (
+    key INTEGER PRIMARY KEY,
+    move INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    nodes INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_eviction ON analysis (used + depth * {DEPTH_AGE});
+"""
+UPSERT = """INSERT INTO analysis (key, move, score, depth, nodes, used) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET move = excluded.move, score = excluded.score, depth = excluded.depth, nodes = excluded.nodes,
+used = excluded.used WHERE excluded.depth >= analysis.depth"""
+
+def signed_key(key : int) -> int:
+    """Zobrist key as the signed 64-bit integer sqlite stores"""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+class AnalysisCache:
+    """Best move, score, depth and node count of searched positions. The file is in WAL mode so any number of processes
+    read it while one writes, each process batches its writes and the last use of entries, and once the cache holds more
+    than max_entries the least recently used and shallowest entries are evicted"""
+    def __init__(self, path : str, max_entries : int = DEFAULT_MAX_ENTRIES, batch_size : int = DEFAULT_BATCH_SIZE,
+                 min_depth : int = DEFAULT_MIN_DEPTH):
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.min_depth = min_depth
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock() #the engine may probe from its ponder thread
+        self.pending = {} #key: (move, score, depth, nodes, used) waiting to be written
+        self.touched = {} #key: time of entries read since the last flush
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Writes what is pending and closes the file"""
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def probe(self, position : Position) -> tuple[int, int, int, int]:
+        """Returns the (packed move without capture flag, score, depth, nodes) stored for the position, or None"""
+        key = signed_key(position.key)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is not None:
+                return entry[:4]
+            row = self.connection.execute("SELECT move, score, depth, nodes FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.touched[key] = time.time()
+        return row
+
+    def store(self, position : Position, move : int, score : int, depth : int, nodes : int):
+        """Queues a search result, it only replaces a stored result that is not deeper"""
+        key = signed_key(position.key)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None or depth >= entry[2]:
+                self.pending[key] = (move & ~CAPTURE, score, depth, nodes, time.time())
+        if len(self.pending) + len(self.touched) >= self.batch_size or time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Commits the pending writes and last uses in one transaction, evicting entries if the cache is over its cap"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending and not self.touched:
+                return
+            pending = [(key, *entry) for key, entry in self.pending.items()]
+            touched = [(used, key) for key, used in self.touched.items() if key not in self.pending]
+            self.pending = {}
+            self.touched = {}
+            connection = self.connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(UPSERT, pending)
+                connection.executemany("UPDATE analysis SET used = max(used, ?) WHERE key = ?", touched)
+                if pending:
+                    self.evict()
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+
+    def evict(self):
+        """Deletes the entries least worth keeping once the cap is exceeded: deep entries count as recently used"""
+        excess = self.connection.execute("SELECT count(*) FROM analysis").fetchone()[0] - self.max_entries
+        if excess > 0:
+            excess += int(self.max_entries * (1 - EVICTION_FRACTION))
+            self.connection.execute(f"DELETE FROM analysis WHERE key IN (SELECT key FROM analysis ORDER BY used + depth * {DEPTH_AGE} LIMIT ?)",
+                                    (excess,))
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.connection.execute("SELECT count(*) FROM analysis").fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up positions in an analysis cache")
+    parser.add_argument("cache", help="cache file")
+    parser.add_argument("--probe", default=None, help="FEN of a position to look up")
+    args = parser.parse_args()
+
+    with AnalysisCache(args.cache) as cache:
+        if args.probe:
+            entry = cache.probe(Position(args.probe))
+            if entry is None:
+                print("not found")
+            else:
+                move, score, depth, nodes = entry
+                print(f"{move_to_uci(move)} score {score} depth {depth} nodes {nodes}")
+        else:
+            print(f"{len(cache)} entries")
+
+if __name__ == '__main__':
+    main()
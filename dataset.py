@@ -0,0 +1,114 @@
+"""Position datasets: files of packed positions that are memory mapped and indexed directly, without parsing any text"""
+import argparse
+import mmap
+import os
+import sys
+from board import Position, PACKED_POSITION, line_to_fen
+
+RECORD_SIZE = PACKED_POSITION.size
+
+def pack_positions(positions) -> bytes:
+    """Packs many positions into one buffer, in order"""
+    return b"".join(position.pack() for position in positions)
+
+def unpack_positions(data):
+    """Yields the positions packed in a buffer, in order"""
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        yield Position.from_packed(data, offset)
+
+def write_dataset(path : str, positions, chunk : int = 4096) -> int:
+    """Writes positions to a dataset file in chunks, returns how many were written"""
+    count = 0
+    batch = []
+    with open(path, 'wb') as file:
+        for position in positions:
+            batch.append(position)
+            if len(batch) == chunk:
+                file.write(pack_positions(batch))
+                count += len(batch)
+                batch.clear()
+        file.write(pack_positions(batch))
+        count += len(batch)
+    return count
+
+class PositionDataset:
+    """Read-only view of a dataset file, records are decoded only when they are indexed"""
+    def __init__(self, path : str):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % RECORD_SIZE:
+            self.file.close()
+            raise ValueError(f"{path} is not a dataset of {RECORD_SIZE}-byte positions")
+        self.records = size // RECORD_SIZE
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        """Closes the mapping and the file"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.records
+
+    def offset(self, index : int) -> int:
+        """Byte offset of a record, negative indices count from the end"""
+        if index < 0:
+            index += self.records
+        if not 0 <= index < self.records:
+            raise IndexError("dataset index out of range")
+        return index * RECORD_SIZE
+
+    def __getitem__(self, index : int) -> Position:
+        return Position.from_packed(self.data, self.offset(index))
+
+    def packed(self, index : int) -> bytes:
+        """The raw 32 bytes of a record"""
+        offset = self.offset(index)
+        return bytes(self.data[offset:offset + RECORD_SIZE])
+
+    def fen(self, index : int) -> str:
+        """FEN of a record"""
+        return self[index].fen()
+
+    def __iter__(self):
+        return unpack_positions(self.data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert FEN or EPD positions to a packed dataset file, or read positions back from one")
+    parser.add_argument("dataset", help="dataset file to write or read")
+    parser.add_argument("sources", nargs='*', help="FEN or EPD files, one position per line, to build the dataset from")
+    parser.add_argument("--fen", type=int, nargs='*', default=None, help="print the FEN of these records, or of every record if none are given")
+    args = parser.parse_args()
+
+    if args.fen is not None:
+        with PositionDataset(args.dataset) as dataset:
+            for index in args.fen or range(len(dataset)):
+                print(dataset.fen(index))
+        return
+
+    def positions():
+        for source in args.sources:
+            with open(source) as file:
+                for number, line in enumerate(file, 1):
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    try:
+                        position = Position(line_to_fen(line))
+                    except (ValueError, IndexError):
+                        print(f"{source}:{number}: invalid FEN, skipped", file=sys.stderr)
+                        continue
+                    if position.occupied.bit_count() > 32:
+                        print(f"{source}:{number}: too many pieces to pack, skipped", file=sys.stderr)
+                        continue
+                    yield position
+    print(f"{write_dataset(args.dataset, positions())} positions written to {args.dataset}")
+
+if __name__ == '__main__':
+    main()
@@ -1,99 +1,572 @@
 """Module for the chess engine"""
-import random
-import copy
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
 from board import Board
-from models import Move
+from bitboard import PAWN, KING, color_index
+from evaluation import PawnTable, evaluate, EXCHANGE_VALUES
+from models import Move, CAPTURE
+from ordering import MoveOrderer, MovePicker, MAX_PLY, QUIET_STAGE
+from stats import SearchStats
+from tablebase import Tablebase, WIN, LOSS
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+INFINITY = 1000000
+MATE_SCORE = 100000 #score of delivering mate now, mates further away score lower
+MAX_DEPTH = 64
+DEFAULT_DEPTH = 4 #depth searched when no budget is given at all
+DEFAULT_MOVETIME_MS = 1000
+DEFAULT_HASH_MB = 16
+MATE_THRESHOLD = MATE_SCORE - 1000 #scores beyond this are forced mates, including the long ones found in the tablebases
+DELTA_MARGIN = 200 #positional swing allowed for when pruning captures in the quiescence search
+#selective search, each part can be switched off through the engine attribute of the same name
+SEARCH_FEATURES = ("null_move", "late_move_reductions", "futility_pruning", "reverse_futility_pruning", "check_extensions")
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2 #plus one for every six plies of depth
+REVERSE_FUTILITY_DEPTH = 3
+REVERSE_FUTILITY_MARGIN = 120 #per ply of depth
+FUTILITY_MARGINS = (0, 200, 400) #indexed by depth, quiet moves are pruned at depth 1 and 2 when even this gain would not reach alpha
+LATE_MOVE_MIN_DEPTH = 3
+LATE_MOVE_MIN_MOVES = 3 #moves searched at full depth before quiet moves start to be reduced
+PONDER_CHARGE_SHARE = 0.5 #most of a move's budget that goes to paying back missed pondering, the rest waits for later moves
+STOP_POLL_SECONDS = 0.02 #how often a parallel search checks whether it was asked to stop while its workers run
+
+class SearchTimeout(Exception):
+    """Raised inside the search when its time or node budget runs out"""
 
 class Engine:
     """Chess engine"""
-    def __init__(self, board : Board, color : str):
+    def __init__(self, board : Board, color : str, depth : int = None, movetime_ms : int = DEFAULT_MOVETIME_MS, nodes : int = None,
+                 hash_mb : float = DEFAULT_HASH_MB, workers : int = 1, book = None,
+                 tablebase = None, cache = None):
         self.board = board
         self.color = color
         self.enemy_color = 'W' if self.color == 'B' else 'B'
+        #budget for every move the engine makes, see search
+        self.depth = depth
+        self.movetime_ms = movetime_ms
+        self.node_limit = nodes
+        self.hash_mb = hash_mb
+        self.transposition_table = TranspositionTable(hash_mb)
+        self.ordering = MoveOrderer() #killer and history tables, kept from one iteration to the next
+        self.pawn_table = PawnTable() #pawn structure scores by pawn key, they only depend on the pawns so they are never stale
+        self.pickers = [MovePicker(self.ordering) for _ in range(MAX_PLY + 1)] #one per ply, reused by every node at that ply
+        #worker processes the root moves are split between, the pool is started on the first parallel search
+        self.workers = workers
+        self.pool = None
+        self.worker_stop = None #multiprocessing.Event shared with the worker processes, set to stop their searches
+        self.book = book #OpeningBook consulted before searching
+        self.tablebase = tablebase #Tablebase probed for perfect play in endings with few pieces
+        self.cache = cache #AnalysisCache of earlier searches, shared with other engine processes through its file
+        #results of the last search
+        self.nodes = 0
+        self.score = 0
+        self.completed_depth = 0
+        self.root_best = None
+        self.start_time = 0
+        self.deadline = None
+        self.max_nodes = None
+        self.stop_requested = False #set from another thread to end the current search early
+        self.stop_event = None #in a worker process, the parent's multiprocessing.Event that also ends the search
+        self.on_iteration = None #called with the engine after every completed iteration of the search, to report progress
+        self.stats = None #SearchStats filled in by every search when set, see stats.py
+        #selective search features, see SEARCH_FEATURES
+        self.null_move = True
+        self.late_move_reductions = True
+        self.futility_pruning = True
+        self.reverse_futility_pruning = True
+        self.check_extensions = True
+        #pondering: a background search of the position after the opponent's expected reply, see ponder
+        self.ponder_thread = None
+        self.ponder_key = None #key of the position being pondered
+        self.ponder_result = None
+        self.game_board = None #the board of the game, while self.board is the pondered copy
+        self.ponder_start = 0
+        self.ponder_time_debt = 0.0 #milliseconds of missed pondering still to be taken from later moves
+        self.ponder_node_debt = 0
 
-    def make_move(self) -> bool:
-        """Engine makes a move"""
-        
+    def make_move(self) -> Move:
+        """Engine makes a move, returns it or None if there are no legal moves"""
         best_move = self.best_move()
         if best_move:
-            print(f"Engine selects the move {best_move.startsquare.rank},{best_move.startsquare.file} to {best_move.endsquare.rank},{best_move.endsquare.file}")
             self.board.make_move(best_move)
-            return True
-        else:
-            return False
-
-    def evaluate_material(self, color) -> int:
-        """Evaluate the position in terms of material"""
-        evaluation = 0
-        for row in self.board.board:
-            for piece in row:
-                evaluation += piece.get_value()
-        if color == 'W':
-            return evaluation
-        elif color == 'B':
-            return -evaluation
-
-    def highest_gain_move(self, movelist : list[Move], color) -> Move:
-        """Returns the move with the highest material gain"""
-        highest_gain = self.evaluate_material(color)
-        highest_gain_move = random.choice(movelist)
-        for move in movelist:
-            restore_piece = copy.deepcopy(self.board.board[move.endsquare.rank][move.endsquare.file])
-            self.board.make_move(move)
-            if self.evaluate_material(color) >= highest_gain:
-                highest_gain = self.evaluate_material(color)
-                highest_gain_move = move
-            self.board.make_move(Move(move.endsquare, move.startsquare))
-            self.board.board[move.endsquare.rank][move.endsquare.file] = restore_piece
-        return highest_gain_move
+        return best_move
+
+    def stop(self):
+        """Ends the current search as soon as possible, it still returns the best move found so far"""
+        self.stop_requested = True
+
+    def evaluate(self, color : int) -> int:
+        """Evaluate the position in centipawns from the point of view of the given color, counted and timed when stats are collected"""
+        stats = self.stats
+        if stats is None:
+            return evaluate(self.board.position, color, self.pawn_table)
+        stats.evaluations += 1
+        return stats.timed("evaluation", evaluate, self.board.position, color, self.pawn_table)
 
     def best_move(self) -> Move:
-        """Engine determines a strong move"""
-        savestate = self.board.board_to_fen() #save the board
-        initial_evaluation = self.evaluate_material(self.color)
-
-        movelist : list[Move] = [] #determine all legal moves
-        for row in self.board.board:
-            for piece in row:
-                if piece.color == self.color:
-                    for move in piece.generate_moves(self.board.board_to_characters()):
-                        if self.board.is_legal_move(move, self.color):
-                            movelist.append(move)
-
-        best_move = self.highest_gain_move(movelist, self.color) #returns the move with the highest material gain, if does not incur a costly immediate response
-        self.board.make_move(best_move)
-        enemy_movelist : list[Move] = []
-        for row in self.board.board:
-            for piece in row:
-                if piece.color == self.enemy_color:
-                    for move in piece.generate_moves(self.board.board_to_characters()):
-                        if self.board.is_legal_move(move, self.enemy_color):
-                            enemy_movelist.append(move)
-        self.board.make_move(self.highest_gain_move(enemy_movelist, self.enemy_color))
-        if self.evaluate_material(self.color) >= initial_evaluation: #returns it if too much material is not lost in response
-            self.board.fen_to_board(savestate) #restore the board
-            return best_move
-
-
-        best_move = random.choice(movelist) #makes the best defensive move
-        best_evaluation = initial_evaluation
-        self.board.fen_to_board(savestate) #restore the board
-        for move in movelist: #test the risk every move possible creates, pick one with the lowest
-            self.board.make_move(move)
-            enemy_movelist : list[Move] = []
-            for row in self.board.board:
-                for piece in row:
-                    if piece.color == self.enemy_color:
-                        for enemy_move in piece.generate_moves(self.board.board_to_characters()):
-                            if self.board.is_legal_move(enemy_move, self.enemy_color):
-                                enemy_movelist.append(enemy_move)
-            self.board.make_move(self.highest_gain_move(enemy_movelist, self.enemy_color))
-            if self.evaluate_material(self.color) > best_evaluation: #pick a move that is not detrimental
-                best_evaluation = self.evaluate_material(self.color)
+        """Engine determines a strong move within its budget, finishing a ponder search if one is running"""
+        if self.ponder_thread is not None:
+            move = self.finish_pondering()
+            if move is not None:
+                return move
+        movetime_ms = self.movetime_ms
+        nodes = self.node_limit
+        if movetime_ms is not None and self.ponder_time_debt: #pay back missed pondering, at most a share of each move
+            charge = min(self.ponder_time_debt, movetime_ms * PONDER_CHARGE_SHARE)
+            self.ponder_time_debt -= charge
+            movetime_ms = max(1, round(movetime_ms - charge))
+        if nodes is not None and self.ponder_node_debt:
+            charge = min(self.ponder_node_debt, int(nodes * PONDER_CHARGE_SHARE))
+            self.ponder_node_debt -= charge
+            nodes = max(1, nodes - charge)
+        return self.search(self.depth, movetime_ms, nodes)
+
+    def ponder(self) -> int:
+        """Starts searching, in the background, the position after the opponent's expected reply (the second move of the
+        principal variation). Returns that reply as a packed move, or None if there is nothing to ponder.
+        The background search is the next move's search started early: on a hit its budget already counts the time spent
+        pondering, on a miss the time and nodes spent are taken from the following moves, so pondering costs no work beyond
+        the game's budget. An engine limited by depth alone has no budget to charge and does not ponder"""
+        if self.ponder_thread is not None:
+            self.finish_pondering()
+        if self.movetime_ms is None and self.node_limit is None:
+            return None
+        line = self.principal_variation(1)
+        if not line:
+            return None
+        board = Board(self.board.board_to_fen())
+        board.position.push(line[0])
+        self.ponder_key = board.position.key
+        self.ponder_result = None
+        self.ponder_start = time.perf_counter()
+        self.game_board = self.board
+        self.board = board
+        self.stop_requested = False
+        self.ponder_thread = threading.Thread(target=self.run_ponder, daemon=True)
+        self.ponder_thread.start()
+        return line[0]
+
+    def run_ponder(self):
+        """Runs on the ponder thread"""
+        self.ponder_result = self.search(self.depth, self.movetime_ms, self.node_limit)
+
+    def finish_pondering(self, cancel : bool = False) -> Move:
+        """Ends pondering once the opponent has moved on the game board. On a ponder hit the background search goes on
+        until its budget, which started when pondering did, runs out and its move is returned. On a miss it is stopped,
+        the time and nodes it used are charged to the following moves and None is returned, either way the transposition
+        and history tables keep what it learned. cancel always stops it"""
+        thread = self.ponder_thread
+        hit = not cancel and self.game_board.position.key == self.ponder_key
+        if not hit:
+            self.stop()
+        thread.join()
+        if not hit:
+            self.ponder_time_debt += (time.perf_counter() - self.ponder_start) * 1000
+            self.ponder_node_debt += self.nodes
+        self.ponder_thread = None
+        self.stop_requested = False
+        self.board = self.game_board
+        self.game_board = None
+        return self.ponder_result if hit else None
+
+    def close(self):
+        """Stops pondering and shuts down the worker processes of the parallel search"""
+        if self.ponder_thread is not None:
+            self.finish_pondering(cancel=True)
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.worker_stop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def search(self, depth : int = None, movetime_ms : int = None, nodes : int = None, root_moves : list[int] = None) -> Move:
+        """Iterative deepening search, returns the best move found when the depth, time or node budget runs out.
+        root_moves optionally restricts the search to some of the legal moves, as packed moves"""
+        position = self.board.position
+        color = color_index(self.color)
+        self.nodes = 0
+        self.score = 0
+        self.completed_depth = 0
+        self.start_time = time.perf_counter()
+        self.deadline = None if movetime_ms is None else self.start_time + movetime_ms / 1000
+        self.max_nodes = nodes
+        self.transposition_table.new_search()
+        self.ordering.new_search()
+        for picker in self.pickers:
+            picker.stats = self.stats
+        if self.stats is not None:
+            self.stats.reset()
+        if depth is None:
+            depth = DEFAULT_DEPTH if movetime_ms is None and nodes is None else MAX_DEPTH
+
+        moves = list(position.legal_moves(color))
+        if root_moves is not None:
+            allowed = {move & ~CAPTURE for move in root_moves}
+            moves = [move for move in moves if move & ~CAPTURE in allowed]
+        if not moves:
+            return None
+        if self.tablebase is not None and color == position.turn:
+            entry = self.tablebase.probe(position)
+            tablebase_move = None if entry is None else self.tablebase.best_move(position)
+            if tablebase_move in moves: #the result is known, no search needed
+                self.score = tablebase_score(entry, 0)
+                self.stop_requested = False
+                return Move.decode(tablebase_move)
+        if self.book is not None and color == position.turn:
+            book_move = self.book.probe(position)
+            if book_move in moves: #a book move is played without searching
+                self.stop_requested = False
+                return Move.decode(book_move)
+        cached_depth = 0
+        if self.cache is not None and color == position.turn and root_moves is None:
+            entry = self.cache.probe(position)
+            legal = {move & ~CAPTURE: move for move in moves}
+            if entry is not None and entry[0] in legal:
+                cached_move = legal[entry[0]]
+                cached_depth = entry[2]
+                if cached_depth >= (depth if depth < MAX_DEPTH else self.cache.min_depth): #deep enough, no search needed
+                    self.score = entry[1]
+                    self.completed_depth = cached_depth
+                    self.transposition_table.store(position.key, cached_move, score_to_table(self.score, 0), cached_depth, EXACT)
+                    self.stop_requested = False
+                    return Move.decode(cached_move)
+                moves.remove(cached_move) #otherwise the cached move is searched first
+                moves.insert(0, cached_move)
+        if self.workers > 1 and len(moves) > 1:
+            move = self.search_parallel(moves, depth, movetime_ms, nodes)
+            self.update_cache(move.encode(), cached_depth, root_moves)
+            return move
+        best_move = moves[0]
+        root_length = len(position.history)
+        for current_depth in range(1, depth + 1):
+            self.root_best = None
+            iteration_start_nodes = self.nodes
+            try:
+                score = self.search_root(moves, color, current_depth)
+            except SearchTimeout:
+                while len(position.history) > root_length: #unwind the moves the search was in the middle of
+                    position.pop()
+                if self.root_best is not None: #the previous best move is searched first, so anything found beats it
+                    best_move, self.score = self.root_best
+                break
+            best_move = self.root_best[0]
+            self.score = score
+            self.completed_depth = current_depth
+            if self.stats is not None:
+                self.stats.iteration_nodes.append(self.nodes - iteration_start_nodes)
+            self.transposition_table.store(position.key, best_move, score_to_table(score, 0), current_depth, EXACT)
+            moves.remove(best_move) #search the best move first in the next iteration
+            moves.insert(0, best_move)
+            if self.on_iteration is not None:
+                self.on_iteration(self)
+            if abs(score) >= MATE_THRESHOLD: #a forced mate was found, deeper searches cannot improve it
+                break
+        self.stop_requested = False
+        if self.stats is not None:
+            self.stats.finish(self.nodes)
+        self.update_cache(best_move, cached_depth, root_moves)
+        return Move.decode(best_move)
+
+    def update_cache(self, move : int, cached_depth : int, root_moves : list[int]):
+        """Writes the result of a search of the whole position back to the cache when it went deeper than the cached one"""
+        position = self.board.position
+        if (self.cache is not None and root_moves is None and self.completed_depth > cached_depth
+                and color_index(self.color) == position.turn):
+            self.cache.store(position, move, self.score, self.completed_depth, self.nodes)
+
+    def search_parallel(self, moves : list[int], depth : int, movetime_ms : int, nodes : int) -> Move:
+        """Splits the root moves between the worker processes, each searches its share with its own transposition table.
+        The best score wins, ties go to the move generated first, so a depth limited search always returns the same move"""
+        if self.pool is None:
+            self.worker_stop = multiprocessing.Event()
+            self.pool = ProcessPoolExecutor(self.workers, initializer=set_worker_stop, initargs=(self.worker_stop,))
+        self.worker_stop.clear()
+        fen = self.board.board_to_fen()
+        shares = [moves[index::self.workers] for index in range(min(self.workers, len(moves)))]
+        worker_nodes = None if nodes is None else max(1, nodes // len(shares))
+        features = {feature: getattr(self, feature) for feature in SEARCH_FEATURES}
+        tablebase_directory = None if self.tablebase is None else self.tablebase.directory
+        futures = [self.pool.submit(search_root_moves, fen, self.color, share, depth, movetime_ms, worker_nodes, self.hash_mb / len(shares),
+                                    features, tablebase_directory, self.stats is not None)
+                   for share in shares]
+        pending = futures
+        while pending: #the workers cannot see stop_requested, so it is passed on through the shared event
+            if self.stop_requested:
+                self.worker_stop.set()
+            pending = wait(pending, timeout=STOP_POLL_SECONDS).not_done
+        results = [future.result() for future in futures]
+        self.stop_requested = False
+
+        order = {move & ~CAPTURE: index for index, move in enumerate(moves)}
+        best_move, self.score = max(results, key=lambda result: (result[1], -order[result[0]]))[:2]
+        self.completed_depth = min(result[2] for result in results)
+        self.nodes = sum(result[3] for result in results)
+        if self.stats is not None: #the workers' counters are added up, the time is that of the whole search
+            for result in results:
+                self.stats.merge(result[4])
+            self.stats.finish(self.nodes)
+        return Move.decode(best_move)
+
+    def search_root(self, moves : list[int], color : int, depth : int) -> int:
+        """Searches every root move to the given depth, records the best one in root_best and returns its score"""
+        position = self.board.position
+        alpha = -INFINITY
+        for move in moves:
+            position.push(move)
+            score = -self.negamax(color ^ 1, depth - 1, -INFINITY, -alpha, 1)
+            position.pop()
+            if score > alpha:
+                alpha = score
+                self.root_best = (move, score)
+        return alpha
+
+    def negamax(self, color : int, depth : int, alpha : int, beta : int, ply : int) -> int:
+        """Alpha-beta search of the current position, returns its score from the point of view of the given color"""
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_budget()
+        position = self.board.position
+        if position.halfmove_clock >= 100: #fifty move rule
+            return 0
+        if self.tablebase is not None and position.occupied.bit_count() <= self.tablebase.max_pieces:
+            entry = self.tablebase.probe(position)
+            if entry is not None:
+                return tablebase_score(entry, ply)
+        stats = self.stats
+        if depth <= 0:
+            self.nodes -= 1 #counted again by the quiescence search
+            return self.quiescence(color, alpha, beta, ply)
+
+        key = position.key
+        original_alpha = alpha
+        tt_move = 0
+        if stats is None:
+            entry = self.transposition_table.probe(key)
+        else:
+            entry = stats.timed("transposition", self.transposition_table.probe, key)
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None:
+            tt_move, tt_score, tt_depth, bound = entry
+            if tt_depth >= depth:
+                tt_score = score_from_table(tt_score, ply)
+                if bound == EXACT or (bound == LOWER_BOUND and tt_score >= beta) or (bound == UPPER_BOUND and tt_score <= alpha):
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return tt_score
+
+        in_check = position.in_check(color)
+        futile = False
+        if not in_check and abs(beta) < MATE_THRESHOLD:
+            static_score = self.evaluate(color)
+            if self.reverse_futility_pruning and depth <= REVERSE_FUTILITY_DEPTH \
+                    and static_score - REVERSE_FUTILITY_MARGIN * depth >= beta: #too far ahead for the opponent to catch up
+                if stats is not None:
+                    stats.reverse_futility_cutoffs += 1
+                return static_score
+            if self.null_move and depth >= NULL_MOVE_MIN_DEPTH and static_score >= beta and position.history[-1][1] is not None \
+                    and position.occupancy[color] & ~(position.bitboards[color][PAWN] | position.bitboards[color][KING]):
+                #passing still fails high, so a real move will too. Not tried with only pawns left, where zugzwang is common
+                position.push_null()
+                score = -self.negamax(color ^ 1, depth - 1 - NULL_MOVE_REDUCTION - depth // 6, -beta, -beta + 1, ply + 1)
+                position.pop()
+                if score >= beta:
+                    if stats is not None:
+                        stats.null_move_cutoffs += 1
+                    return beta if score >= MATE_THRESHOLD else score
+            futile = self.futility_pruning and depth < len(FUTILITY_MARGINS) and static_score + FUTILITY_MARGINS[depth] <= alpha
+
+        picker = self.pickers[ply]
+        picker.reset(position, color, tt_move, ply)
+        best_score = -INFINITY
+        best_move = 0
+        searched = 0
+        while move := picker.next():
+            quiet = not move & (CAPTURE | 7 << 12)
+            position.push(move)
+            gives_check = position.in_check(color ^ 1)
+            if futile and quiet and searched and not gives_check:
+                position.pop()
+                if stats is not None:
+                    stats.futility_pruned += 1
+                continue
+            searched += 1
+            new_depth = depth - 1
+            if gives_check and self.check_extensions and ply < MAX_DEPTH:
+                new_depth += 1
+                if stats is not None:
+                    stats.extensions += 1
+            if self.late_move_reductions and quiet and searched > LATE_MOVE_MIN_MOVES and depth >= LATE_MOVE_MIN_DEPTH \
+                    and not in_check and not gives_check and picker.stage == QUIET_STAGE:
+                #late quiet moves rarely matter, so they get a cheaper search and only a full one if they beat alpha
+                reduction = 1 if searched < 12 else 2
+                score = -self.negamax(color ^ 1, new_depth - reduction, -alpha - 1, -alpha, ply + 1)
+                if stats is not None:
+                    stats.reductions += 1
+                if score > alpha:
+                    if stats is not None:
+                        stats.re_searches += 1
+                    score = -self.negamax(color ^ 1, new_depth, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(color ^ 1, new_depth, -beta, -alpha, ply + 1)
+            position.pop()
+            if score > best_score:
+                best_score = score
                 best_move = move
-            self.board.fen_to_board(savestate) #restore the board
-        return best_move
-        
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if quiet:
+                            self.ordering.record_cutoff(move, color, ply, depth)
+                        if stats is not None:
+                            stats.beta_cutoffs += 1
+                            stats.first_move_cutoffs += searched == 1
+                        break
+        if stats is not None:
+            stats.moves_generated += picker.generated
+        if not searched: #no legal moves, checkmate or stalemate
+            return -MATE_SCORE + ply if in_check else 0
+
+        if best_score >= beta:
+            bound = LOWER_BOUND
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER_BOUND
+            best_move = 0 #every move failed low, none of them is known to be best
+        if stats is None:
+            self.transposition_table.store(key, best_move, score_to_table(best_score, ply), depth, bound)
+        else:
+            stats.timed("transposition", self.transposition_table.store, key, best_move, score_to_table(best_score, ply), depth, bound)
+        return best_score
+
+    def quiescence(self, color : int, alpha : int, beta : int, ply : int) -> int:
+        """Searches captures and promotions until the position is quiet, so leaves are not scored in the middle of an exchange.
+        The side to move may stand pat on the static evaluation, except in check where every evasion is searched"""
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_budget()
+        stats = self.stats
+        position = self.board.position
+        if stats is not None:
+            stats.qnodes += 1
+        if ply >= MAX_PLY:
+            return self.evaluate(color)
+        in_check = position.in_check(color)
+        if in_check:
+            best_score = -INFINITY
+        else:
+            best_score = self.evaluate(color)
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+
+        picker = self.pickers[ply]
+        picker.reset(position, color, 0, ply, quiets=in_check) #only evasions may be quiet
+        searched = 0
+        while move := picker.next():
+            searched += 1
+            if not in_check and not move >> 12 & 7:
+                victim = position.mailbox[move >> 6 & 63]
+                if best_score + (EXCHANGE_VALUES[victim[1]] if victim else EXCHANGE_VALUES[PAWN]) + DELTA_MARGIN <= alpha:
+                    continue #delta pruning, even winning the piece for free would not bring the score up to alpha
+                if position.static_exchange(move) < 0:
+                    continue #the exchange loses material
+            position.push(move)
+            score = -self.quiescence(color ^ 1, -beta, -alpha, ply + 1)
+            position.pop()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if stats is not None:
+            stats.moves_generated += picker.generated
+        if in_check and not searched:
+            return -MATE_SCORE + ply
+        return best_score
+
+    def principal_variation(self, length : int = MAX_DEPTH) -> list[int]:
+        """Follows the best moves stored in the transposition table from the current position, returns them as packed moves"""
+        position = self.board.position
+        line = []
+        seen = set()
+        while len(line) < length and position.key not in seen:
+            seen.add(position.key)
+            entry = self.transposition_table.probe(position.key)
+            if entry is None or not entry[0]:
+                break
+            legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+            move = legal.get(entry[0] & ~CAPTURE)
+            if move is None:
+                break
+            line.append(move)
+            position.push(move)
+        for _ in line:
+            position.pop()
+        return line
+
+    def check_budget(self):
+        """Stops the search if it has used up its time or nodes, or was asked to stop"""
+        if self.stop_requested or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchTimeout
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout
+
+def score_to_table(score : int, ply : int) -> int:
+    """Mate scores are stored relative to the stored position rather than the root"""
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def score_from_table(score : int, ply : int) -> int:
+    """Converts a stored mate score back to be relative to the root"""
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+def tablebase_score(entry : tuple[int, int], ply : int) -> int:
+    """Search score of a tablebase result, with its mate distance counted from the root"""
+    result, plies = entry
+    if result == WIN:
+        return MATE_SCORE - ply - plies
+    if result == LOSS:
+        return -MATE_SCORE + ply + plies
+    return 0
 
+_worker_tablebases = {} #tablebases opened by a worker process, by directory, kept open for its later searches
+_worker_stop = None #the parent engine's stop event, handed to each worker process when the pool starts it
 
+def set_worker_stop(event):
+    """Pool initializer: keeps the parent engine's stop event for the searches of this worker process"""
+    global _worker_stop
+    _worker_stop = event
 
+def search_root_moves(fen : str, color : str, moves : list[int], depth : int, movetime_ms : int, nodes : int, hash_mb : float,
+                      features : dict = None, tablebase_directory : str = None, collect_stats : bool = False) -> tuple:
+    """Runs in a worker process: searches some of the root moves of a position with the parent engine's search features
+    and tablebase, returns (packed move, score, completed depth, nodes, the SearchStats counters or None)"""
+    if tablebase_directory is not None and tablebase_directory not in _worker_tablebases:
+        _worker_tablebases[tablebase_directory] = Tablebase(tablebase_directory)
+    engine = Engine(Board(fen), color, hash_mb=hash_mb, tablebase=_worker_tablebases.get(tablebase_directory))
+    engine.stop_event = _worker_stop
+    for feature, enabled in (features or {}).items():
+        setattr(engine, feature, enabled)
+    if collect_stats:
+        engine.stats = SearchStats()
+    move = engine.search(depth, movetime_ms, nodes, root_moves=moves)
+    return move.encode(), engine.score, engine.completed_depth, engine.nodes, engine.stats.as_dict() if collect_stats else None
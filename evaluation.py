@@ -0,0 +1,219 @@
+"""Evaluation: piece-square tables tapered between the middlegame and the endgame, pawn structure and king safety"""
+from bitboard import WHITE, BLACK, PAWN, KING, FULL, FILE_A, iterate_bits, lowest_square
+from attacks import PAWN_ATTACKS
+
+#Piece values in centipawns, indexed by piece type
+MIDDLEGAME_VALUES = (100, 320, 330, 500, 900, 0)
+ENDGAME_VALUES = (120, 300, 320, 520, 920, 0)
+EXCHANGE_VALUES = (100, 320, 330, 500, 900, 20000) #for static exchange evaluation, where a king can only capture last
+
+#How much each piece type counts towards the middlegame, a full set of pieces adds up to MAX_PHASE
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+#Bonuses per square from white's point of view, written with the eighth rank at the top
+PAWN_MIDDLEGAME = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+)
+PAWN_ENDGAME = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_MIDDLEGAME = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+)
+KING_ENDGAME = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+def _build_tables(values : tuple, tables : tuple) -> list:
+    """Combines piece values and square bonuses into [color][piece type][square] scores from white's point of view"""
+    white = [[values[piece_type] + table[(7 - square // 8) * 8 + square % 8] for square in range(64)] for piece_type, table in enumerate(tables)]
+    black = [[-(values[piece_type] + table[square]) for square in range(64)] for piece_type, table in enumerate(tables)] #mirrored vertically
+    return [white, black]
+
+MIDDLEGAME_TABLES = _build_tables(MIDDLEGAME_VALUES, (PAWN_MIDDLEGAME, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_MIDDLEGAME))
+ENDGAME_TABLES = _build_tables(ENDGAME_VALUES, (PAWN_ENDGAME, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_ENDGAME))
+
+#Pawn structure terms as (middlegame, endgame) centipawns
+DOUBLED_PENALTY = (10, 25) #for each pawn with another pawn of its color in front of it on the same file
+ISOLATED_PENALTY = (15, 20) #no pawn of its color on the neighbouring files
+BACKWARD_PENALTY = (10, 15) #no pawn of its color beside or behind it on the neighbouring files, and its stop square is attacked by an enemy pawn
+#Bonus of a passed pawn indexed by its rank counted from its own side, on top of the piece-square tables
+PASSED_MIDDLEGAME = (0, 5, 5, 10, 20, 35, 60, 0)
+PASSED_ENDGAME = (0, 10, 15, 25, 45, 75, 110, 0)
+#King safety, middlegame only: pawns on the three files around the king one and two ranks in front of it, files there without them
+SHIELD_BONUS = (15, 8)
+KING_OPEN_FILE_PENALTY = 20 #for each of those files with no pawn of the king's color
+DEFAULT_PAWN_ENTRIES = 1 << 14
+
+FILE_MASKS = [FILE_A << file for file in range(8)]
+ADJACENT_FILES = [(FILE_MASKS[file - 1] if file > 0 else 0) | (FILE_MASKS[file + 1] if file < 7 else 0) for file in range(8)]
+#Ranks strictly in front of the given rank, from each color's point of view
+FORWARD_RANKS = ([FULL << 8 * (rank + 1) & FULL for rank in range(8)], [(1 << 8 * rank) - 1 for rank in range(8)])
+#Squares in front of a pawn on its own file, on its file and the neighbouring ones (enemy pawns there stop it from being passed),
+#and beside or behind it on the neighbouring files (pawns there can support it), indexed by color and square
+FRONT_SPANS = [[FORWARD_RANKS[color][square // 8] & FILE_MASKS[square % 8] for square in range(64)] for color in (WHITE, BLACK)]
+PASSED_MASKS = [[FORWARD_RANKS[color][square // 8] & (FILE_MASKS[square % 8] | ADJACENT_FILES[square % 8]) for square in range(64)]
+                for color in (WHITE, BLACK)]
+SUPPORT_MASKS = [[ADJACENT_FILES[square % 8] & ~FORWARD_RANKS[color][square // 8] & FULL for square in range(64)] for color in (WHITE, BLACK)]
+def _shield_mask(color : int, square : int, distance : int) -> int:
+    """Squares the given number of ranks in front of a king on its file and the neighbouring ones"""
+    rank = square // 8 + distance if color == WHITE else square // 8 - distance
+    if not 0 <= rank < 8:
+        return 0
+    return 0xFF << 8 * rank & (FILE_MASKS[square % 8] | ADJACENT_FILES[square % 8])
+
+#Pawn shield squares of a king, indexed by color, distance in front of the king (one or two ranks) and square
+SHIELD_MASKS = [[[_shield_mask(color, square, distance) for square in range(64)] for distance in (1, 2)] for color in (WHITE, BLACK)]
+
+def evaluate_pawns(position) -> tuple[int, int]:
+    """Pawn structure scores (middlegame, endgame) from white's point of view: passed, doubled, isolated and backward pawns.
+    They depend on the pawns only, see PawnTable"""
+    middlegame = endgame = 0
+    pawns = (position.bitboards[WHITE][PAWN], position.bitboards[BLACK][PAWN])
+    for color in (WHITE, BLACK):
+        own = pawns[color]
+        enemy = pawns[color ^ 1]
+        sign = 1 if color == WHITE else -1
+        for square in iterate_bits(own):
+            file = square % 8
+            if own & FRONT_SPANS[color][square]:
+                middlegame -= sign * DOUBLED_PENALTY[0]
+                endgame -= sign * DOUBLED_PENALTY[1]
+            elif not enemy & PASSED_MASKS[color][square]:
+                rank = square // 8 if color == WHITE else 7 - square // 8
+                middlegame += sign * PASSED_MIDDLEGAME[rank]
+                endgame += sign * PASSED_ENDGAME[rank]
+            if not own & ADJACENT_FILES[file]:
+                middlegame -= sign * ISOLATED_PENALTY[0]
+                endgame -= sign * ISOLATED_PENALTY[1]
+            elif not own & SUPPORT_MASKS[color][square]:
+                stop = square + 8 if color == WHITE else square - 8
+                if 0 <= stop < 64 and enemy & PAWN_ATTACKS[color][stop]:
+                    middlegame -= sign * BACKWARD_PENALTY[0]
+                    endgame -= sign * BACKWARD_PENALTY[1]
+    return middlegame, endgame
+
+def king_safety(position) -> int:
+    """Middlegame king safety from white's point of view: the pawn shield in front of each king and open files beside it"""
+    score = 0
+    for color in (WHITE, BLACK):
+        king = position.bitboards[color][KING]
+        if not king:
+            continue
+        square = lowest_square(king)
+        own = position.bitboards[color][PAWN]
+        safety = (SHIELD_BONUS[0] * (own & SHIELD_MASKS[color][0][square]).bit_count()
+                  + SHIELD_BONUS[1] * (own & SHIELD_MASKS[color][1][square]).bit_count())
+        file = square % 8
+        for neighbour in range(max(0, file - 1), min(7, file + 1) + 1):
+            if not own & FILE_MASKS[neighbour]:
+                safety -= KING_OPEN_FILE_PENALTY
+        score += safety if color == WHITE else -safety
+    return score
+
+class PawnTable:
+    """Pawn structure scores by the position's pawn key. Pawns move rarely, so almost every evaluation finds its
+    structure here instead of recomputing it"""
+    def __init__(self, entries : int = DEFAULT_PAWN_ENTRIES):
+        self.size = entries
+        self.entries = [None] * entries #(pawn key, middlegame, endgame)
+        self.hits = 0
+        self.probes = 0
+
+    def clear(self):
+        """Remove every entry and reset the hit counts"""
+        self.entries = [None] * self.size
+        self.hits = 0
+        self.probes = 0
+
+    def probe(self, position) -> tuple[int, int]:
+        """Returns the pawn structure scores of the position, computing and storing them on a miss"""
+        key = position.pawn_key
+        index = key % self.size
+        entry = self.entries[index]
+        self.probes += 1
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1], entry[2]
+        middlegame, endgame = evaluate_pawns(position)
+        self.entries[index] = (key, middlegame, endgame)
+        return middlegame, endgame
+
+def evaluate(position, color : int, pawn_table : PawnTable = None) -> int:
+    """Tapered evaluation in centipawns from the point of view of the given color: the position's incremental material and
+    piece-square scores, pawn structure (cached in the pawn table when one is given) and king safety"""
+    pawn_middlegame, pawn_endgame = evaluate_pawns(position) if pawn_table is None else pawn_table.probe(position)
+    phase = min(position.phase, MAX_PHASE)
+    middlegame = position.middlegame_score + pawn_middlegame + king_safety(position)
+    endgame = position.endgame_score + pawn_endgame
+    score = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if color == WHITE else -score
@@ -20,7 +20,11 @@ def main():
         endrank = int(input("Enter the ending y coord: "))
         endfile = int(input("Enter the ending x coord: "))
         board.make_move(Move(Square(startrank, startfile), Square(endrank, endfile)))
-        if not engine.make_move():
+        engine_move = engine.make_move()
+        if engine_move:
+            print(f"Engine selects the move {engine_move.startsquare.rank},{engine_move.startsquare.file} to {engine_move.endsquare.rank},{engine_move.endsquare.file}")
+            engine.ponder() #think about the expected reply while the player decides
+        else:
             if board.is_in_checkmate(engine.color):
                 print("Checkmate! You win!")
             elif board.is_in_stalemate(engine.color):
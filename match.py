@@ -0,0 +1,251 @@
+"""Self-play matches between two engine configurations, played in parallel, with Elo and SPRT statistics"""
+import argparse
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from board import Board, Position, STARTING_FEN, line_to_fen
+from bitboard import COLOR_NAMES, PAWN, ROOK, QUEEN, popcount
+from engine import Engine, SEARCH_FEATURES
+from models import CAPTURE, uci_to_move
+
+#Short opening lines the games start from when no openings file is given, each is played once with either side as white
+OPENING_LINES = (
+    "e2e4 e7e5 g1f3 b8c6 f1b5",
+    "e2e4 e7e5 g1f3 b8c6 f1c4",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 c7c5 b1c3 b8c6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 d7d5 c2c4 c7c6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "d2d4 g8f6 c2c4 e7e6 g1f3",
+    "c2c4 e7e5 b1c3",
+    "g1f3 d7d5 g2g3",
+)
+DEFAULT_MAX_PLIES = 400 #games still going after this many plies are adjudicated as draws
+
+def line_to_opening(line : str) -> str:
+    """FEN of the position after a line of UCI moves from the starting position"""
+    position = Position(STARTING_FEN)
+    for text in line.split():
+        legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+        position.push(legal[uci_to_move(text)])
+    return position.fen()
+
+def parse_config(text : str) -> dict:
+    """Engine configuration from key=value pairs, e.g. "nodes=5000 hash=8 null_move=0".
+    Keys are depth, movetime (ms), nodes, hash (MB) and the selective search features"""
+    config = {}
+    for pair in text.split():
+        key, _, value = pair.partition('=')
+        if key in ("depth", "movetime", "nodes"):
+            config[key] = int(value)
+        elif key == "hash":
+            config[key] = float(value)
+        elif key in SEARCH_FEATURES:
+            config[key] = value.lower() not in ("0", "false", "off", "no")
+        else:
+            raise ValueError(f"unknown engine option {key}")
+    return config
+
+def make_engine(board : Board, color : str, config : dict) -> Engine:
+    """Engine playing one side of a game with the given configuration"""
+    engine = Engine(board, color, depth=config.get("depth"), movetime_ms=config.get("movetime"), nodes=config.get("nodes"),
+                    hash_mb=config.get("hash", 16))
+    for feature in SEARCH_FEATURES:
+        setattr(engine, feature, config.get(feature, True))
+    return engine
+
+def insufficient_material(position : Position) -> bool:
+    """Neither side can mate: bare kings, or a single knight or bishop against a bare king"""
+    for color in (0, 1):
+        pieces = position.bitboards[color]
+        if pieces[PAWN] or pieces[ROOK] or pieces[QUEEN]:
+            return False
+    return popcount(position.occupied) <= 3
+
+def play_game(index : int, fen : str, white : dict, black : dict, max_plies : int = DEFAULT_MAX_PLIES) -> dict:
+    """Plays one game between two configurations, returns the result as 1, 0.5 or 0 for white, why the game ended,
+    and the nodes searched and search time of each side"""
+    board = Board(fen)
+    position = board.position
+    engines = [make_engine(board, 'W', white), make_engine(board, 'B', black)]
+    nodes = [0, 0]
+    times = [0.0, 0.0]
+    seen = {position.key: 1}
+    result = None
+    for _ in range(max_plies):
+        color = COLOR_NAMES[position.turn]
+        if board.is_in_checkmate(color):
+            result = (0.0 if position.turn == 0 else 1.0, "checkmate")
+        elif board.is_in_stalemate(color):
+            result = (0.5, "stalemate")
+        elif position.halfmove_clock >= 100:
+            result = (0.5, "fifty moves")
+        elif seen[position.key] >= 3:
+            result = (0.5, "repetition")
+        elif insufficient_material(position):
+            result = (0.5, "insufficient material")
+        if result is not None:
+            break
+        side = position.turn
+        start = time.perf_counter()
+        move = engines[side].make_move()
+        times[side] += time.perf_counter() - start
+        nodes[side] += engines[side].nodes
+        if move is None:
+            break
+        seen[position.key] = seen.get(position.key, 0) + 1
+    score, reason = result or (0.5, "move limit")
+    return {"index": index, "score": score, "reason": reason, "plies": len(position.history), "nodes": nodes, "times": times}
+
+def elo_difference(score : float) -> float:
+    """Elo difference that gives the expected score"""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def expected_score(elo : float) -> float:
+    """Expected score of a player the given number of Elo points stronger"""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo_estimate(wins : int, draws : int, losses : int) -> tuple[float, float]:
+    """Elo difference of the first engine with the half-width of its 95% confidence interval"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo_difference(score), (elo_difference(score + margin) - elo_difference(score - margin)) / 2
+
+def sprt_llr(wins : int, draws : int, losses : int, elo0 : float, elo1 : float) -> float:
+    """Log likelihood ratio of the hypotheses elo1 against elo0 for the first engine, from the normal approximation
+    of the generalized SPRT on the per game scores"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance <= 0:
+        return 0.0
+    score0 = expected_score(elo0)
+    score1 = expected_score(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+def sprt_bounds(alpha : float, beta : float) -> tuple[float, float]:
+    """LLR bounds below which H0 and above which H1 is accepted"""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+class MatchResult:
+    """Running totals of a match from the first engine's point of view"""
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.reasons = {}
+        self.nodes = [0, 0] #first, second
+        self.times = [0.0, 0.0]
+
+    def add(self, game : dict, first_is_white : bool):
+        """Counts a finished game, as returned by play_game"""
+        score = game["score"] if first_is_white else 1 - game["score"]
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.reasons[game["reason"]] = self.reasons.get(game["reason"], 0) + 1
+        for side in (0, 1):
+            player = side if first_is_white else 1 - side #white is index 0 in the game
+            self.nodes[player] += game["nodes"][side]
+            self.times[player] += game["times"][side]
+
+    @property
+    def games(self) -> int:
+        """Number of games counted so far"""
+        return self.wins + self.draws + self.losses
+
+    def nps(self, player : int) -> float:
+        """Nodes per second of a player (0 for the first engine, 1 for the second) over all its searches"""
+        return self.nodes[player] / self.times[player] if self.times[player] else 0.0
+
+def run_match(first : dict, second : dict, openings : list[str], games : int, workers : int = 1, max_plies : int = DEFAULT_MAX_PLIES,
+              elo0 : float = 0.0, elo1 : float = 10.0, alpha : float = 0.05, beta : float = 0.05, stop_on_sprt : bool = False,
+              report = None) -> MatchResult:
+    """Plays the games in worker processes, each opening twice with the colors swapped, and returns the totals.
+    report is called with the running totals after every game, stop_on_sprt ends the match once the SPRT has a verdict"""
+    result = MatchResult()
+    lower, upper = sprt_bounds(alpha, beta)
+
+    def schedule(pool, index):
+        fen = openings[index // 2 % len(openings)]
+        white, black = (first, second) if index % 2 == 0 else (second, first)
+        return pool.submit(play_game, index, fen, white, black, max_plies)
+
+    with ProcessPoolExecutor(workers) as pool:
+        next_index = 0
+        pending = set()
+        while next_index < games or pending:
+            while next_index < games and len(pending) < workers * 2:
+                pending.add(schedule(pool, next_index))
+                next_index += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game = future.result()
+                result.add(game, game["index"] % 2 == 0)
+                if report is not None:
+                    report(result)
+            if stop_on_sprt:
+                llr = sprt_llr(result.wins, result.draws, result.losses, elo0, elo1)
+                if llr <= lower or llr >= upper:
+                    for future in pending:
+                        future.cancel()
+                    break
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine games between two configurations and measure the Elo difference")
+    parser.add_argument("--first", default="", help='first engine configuration, e.g. "nodes=5000 null_move=0"')
+    parser.add_argument("--second", default="", help="second engine configuration")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--workers", type=int, default=2, help="games played at once")
+    parser.add_argument("--openings", default=None, help="file of opening FEN or EPD positions, one per line")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="plies after which a game is a draw")
+    parser.add_argument("--elo0", type=float, default=0.0, help="SPRT null hypothesis, in Elo")
+    parser.add_argument("--elo1", type=float, default=10.0, help="SPRT alternative hypothesis, in Elo")
+    parser.add_argument("--alpha", type=float, default=0.05, help="SPRT false positive rate")
+    parser.add_argument("--beta", type=float, default=0.05, help="SPRT false negative rate")
+    parser.add_argument("--sprt", action="store_true", help="stop as soon as the SPRT accepts a hypothesis")
+    args = parser.parse_args()
+
+    first = parse_config(args.first)
+    second = parse_config(args.second)
+    for config in (first, second):
+        if not {"depth", "movetime", "nodes"} & config.keys():
+            config["movetime"] = 100
+    if args.openings:
+        with open(args.openings) as file:
+            openings = [line_to_fen(line) for line in file if line.strip() and not line.startswith('#')]
+    else:
+        openings = [line_to_opening(line) for line in OPENING_LINES]
+    lower, upper = sprt_bounds(args.alpha, args.beta)
+    start = time.perf_counter()
+
+    def report(result : MatchResult):
+        elo, margin = elo_estimate(result.wins, result.draws, result.losses)
+        llr = sprt_llr(result.wins, result.draws, result.losses, args.elo0, args.elo1)
+        print(f"games {result.games} +{result.wins} ={result.draws} -{result.losses} elo {elo:+.1f} +/- {margin:.1f} "
+              f"llr {llr:.2f} ({lower:.2f}, {upper:.2f}) games/s {result.games / (time.perf_counter() - start):.2f}", flush=True)
+
+    result = run_match(first, second, openings, args.games, args.workers, args.max_plies, args.elo0, args.elo1,
+                       args.alpha, args.beta, args.sprt, report)
+    llr = sprt_llr(result.wins, result.draws, result.losses, args.elo0, args.elo1)
+    verdict = "H1 accepted" if llr >= upper else "H0 accepted" if llr <= lower else "inconclusive"
+    print(f"sprt [{args.elo0:g}, {args.elo1:g}]: {verdict}")
+    print("endings: " + ", ".join(f"{reason} {count}" for reason, count in sorted(result.reasons.items())))
+    print(f"nps first {result.nps(0):.0f} second {result.nps(1):.0f}")
+
+if __name__ == '__main__':
+    main()
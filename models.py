@@ -1,13 +1,89 @@
 """Representations for squares and moves on the chessboard"""
 
+#Moves are packed into 16 bits: start square (bits 0-5), end square (bits 6-11),
+#promotion piece type (bits 12-14, 0 if none) and a capture flag (bit 15)
+CAPTURE = 1 << 15
+
+def encode_move(start : int, end : int, promotion : int = 0, capture : bool = False) -> int:
+    """Packs a move into a 16-bit integer"""
+    return start | end << 6 | promotion << 12 | (CAPTURE if capture else 0)
+
+def move_to_uci(move : int) -> str:
+    """Long algebraic (UCI) notation of a packed move, e.g. e2e4 or e7e8q"""
+    start = move & 63
+    end = move >> 6 & 63
+    text = "abcdefgh"[start % 8] + str(start // 8 + 1) + "abcdefgh"[end % 8] + str(end // 8 + 1)
+    promotion = move >> 12 & 7
+    return text + " nbrq"[promotion] if promotion else text
+
+def uci_to_move(text : str) -> int:
+    """Packs a move in long algebraic (UCI) notation, without the capture flag"""
+    start = (int(text[1]) - 1) * 8 + "abcdefgh".index(text[0])
+    end = (int(text[3]) - 1) * 8 + "abcdefgh".index(text[2])
+    promotion = " nbrq".index(text[4]) if len(text) > 4 else 0
+    return encode_move(start, end, promotion)
+
 class Square:
-    """Representation of a square on the chess board"""
-    def __init__(self, rank : int, file : int):
-        self.rank = rank
-        self.file = file
+    """Representation of a square on the chess board, the 64 squares on the board are shared instances"""
+    __slots__ = ('rank', 'file')
+
+    def __new__(cls, rank : int, file : int):
+        if 0 <= rank < 8 and 0 <= file < 8 and len(SQUARES) == 64:
+            return SQUARES[rank * 8 + file]
+        square = object.__new__(cls) #off the board squares can still be entered, they are rejected when the move is made
+        square.rank = rank
+        square.file = file
+        return square
+
+    def __reduce__(self):
+        """Pickles and copies through the constructor, so the squares on the board stay the shared instances"""
+        return (Square, (self.rank, self.file))
+
+    @property
+    def index(self) -> int:
+        """Index of the square, from 0 (rank 0, file 0) to 63 (rank 7, file 7)"""
+        return self.rank * 8 + self.file
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Square) and self.rank == other.rank and self.file == other.file
+
+    def __hash__(self) -> int:
+        return hash((self.rank, self.file))
+
+    def __repr__(self) -> str:
+        return f"Square({self.rank}, {self.file})"
+
+SQUARES : list[Square] = []
+SQUARES.extend(Square(index // 8, index % 8) for index in range(64))
 
 class Move:
     """Models a potentional move"""
-    def __init__(self, startsquare : Square, endsquare : Square):
+    __slots__ = ('startsquare', 'endsquare', 'promotion')
+
+    def __init__(self, startsquare : Square, endsquare : Square, promotion : int = None):
         self.startsquare = startsquare
         self.endsquare = endsquare
+        self.promotion = promotion #piece type a pawn promotes to, a queen if not specified
+
+    def __reduce__(self):
+        """Pickles and copies through the constructor, every pickle protocol handles it despite the slots"""
+        return (Move, (self.startsquare, self.endsquare, self.promotion))
+
+    @classmethod
+    def decode(cls, move : int):
+        """Builds a move from its packed 16-bit form"""
+        return cls(SQUARES[move & 63], SQUARES[move >> 6 & 63], move >> 12 & 7 or None)
+
+    def encode(self) -> int:
+        """Packs the move into 16 bits, the squares must be on the board"""
+        return encode_move(self.startsquare.index, self.endsquare.index, self.promotion or 0)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Move) and self.startsquare == other.startsquare and self.endsquare == other.endsquare \
+            and self.promotion == other.promotion
+
+    def __hash__(self) -> int:
+        return hash((self.startsquare, self.endsquare, self.promotion))
+
+    def __repr__(self) -> str:
+        return f"Move({self.startsquare!r}, {self.endsquare!r}, {self.promotion!r})"
@@ -0,0 +1,176 @@
+"""Move ordering for the search: the transposition table move, then captures by MVV-LVA, then killer moves and the history heuristic"""
+import time
+from bitboard import PAWN
+from board import NOISY_MOVES, QUIET_MOVES, ALL_MOVES
+from models import CAPTURE
+
+MAX_PLY = 128 #deepest ply killer moves are kept for
+MAX_MOVES = 256 #more than any position has, the size of each move picker buffer
+CAPTURE_SCORE = 1 << 28 #captures come before quiet moves, ordered among themselves by MVV-LVA
+PROMOTION_SCORE = 1 << 27
+KILLER_SCORES = (1 << 26, (1 << 26) - 1) #the most recent killer first
+HISTORY_LIMIT = 1 << 25 #history scores are halved once any of them reaches this, so they stay below the killers
+
+class MoveOrderer:
+    """Scores the moves of a node, the killer and history tables learn from beta cutoffs and are kept across iterations"""
+    def __init__(self):
+        self.killers = [[0, 0] for _ in range(MAX_PLY)] #two quiet moves per ply that recently caused a cutoff
+        self.history = [0] * 8192 #indexed by color << 12 | start square | end square << 6 of quiet moves, the low 12 bits of the move
+
+    def clear(self):
+        """Forgets everything learned, for a new game"""
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history = [0] * 8192
+
+    def new_search(self):
+        """Killers belong to the previous position, old history is kept but counts half as much"""
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history = [score >> 1 for score in self.history]
+
+    def score(self, position, move : int, color : int, ply : int) -> int:
+        """Ordering score of a move, higher scores are searched first"""
+        if move & CAPTURE:
+            victim = position.mailbox[move >> 6 & 63]
+            victim_type = PAWN if victim is None else victim[1] #an en passant capture lands on an empty square
+            return CAPTURE_SCORE + victim_type * 8 + 5 - position.mailbox[move & 63][1] #most valuable victim, least valuable attacker
+        if move >> 12 & 7:
+            return PROMOTION_SCORE + (move >> 12 & 7)
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        if move == killers[0]:
+            return KILLER_SCORES[0]
+        if move == killers[1]:
+            return KILLER_SCORES[1]
+        return self.history[color << 12 | move & 4095]
+
+    def record_cutoff(self, move : int, color : int, ply : int, depth : int):
+        """Rewards a quiet move that caused a beta cutoff"""
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        index = color << 12 | move & 4095
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = [score >> 1 for score in self.history]
+
+#Stages of a move picker, in the order moves are handed out
+TT_STAGE = 0
+GENERATE_NOISY_STAGE = 1
+NOISY_STAGE = 2
+KILLER_STAGE = 3
+GENERATE_QUIET_STAGE = 4
+QUIET_STAGE = 5
+DONE_STAGE = 6
+
+class MovePicker:
+    """Hands out the legal moves of a node best first, in stages: the transposition table move, captures and promotions,
+    killer moves, then quiet moves. A stage is only generated once the previous ones are used up without a cutoff, and the
+    engine keeps one picker per ply so its buffers are reused from node to node"""
+    def __init__(self, orderer : MoveOrderer):
+        self.orderer = orderer
+        self.stats = None #SearchStats timing move generation, set by the engine
+        self.moves = [0] * MAX_MOVES
+        self.scores = [0] * MAX_MOVES
+        self.count = 0
+        self.index = 0
+        self.generated = 0 #moves generated at the current node
+
+    def reset(self, position, color : int, tt_move : int, ply : int, quiets : bool = True):
+        """Prepares the picker for a new node, quiets=False limits it to captures and promotions"""
+        self.position = position
+        self.color = color
+        self.tt_move = tt_move
+        self.ply = ply
+        self.quiets = quiets
+        self.stage = TT_STAGE
+        self.killers_played = []
+        self.count = 0
+        self.index = 0
+        self.generated = 0
+
+    def next(self) -> int:
+        """Returns the next move to search, 0 once every move has been handed out"""
+        while True:
+            stage = self.stage
+            if stage == TT_STAGE:
+                self.stage = GENERATE_NOISY_STAGE
+                move = self.tt_move
+                if move and (self.quiets or move & CAPTURE or move >> 12 & 7) and self.is_legal(move, ALL_MOVES):
+                    return move
+                self.tt_move = 0
+            elif stage == GENERATE_NOISY_STAGE:
+                self.fill(NOISY_MOVES)
+                self.stage = NOISY_STAGE
+            elif stage == NOISY_STAGE:
+                move = self.select()
+                if move:
+                    return move
+                self.stage = KILLER_STAGE if self.quiets else DONE_STAGE
+            elif stage == KILLER_STAGE:
+                for killer in self.orderer.killers[self.ply] if self.ply < MAX_PLY else ():
+                    if killer and killer != self.tt_move and killer not in self.killers_played and self.is_legal(killer, QUIET_MOVES):
+                        self.killers_played.append(killer)
+                        return killer
+                self.stage = GENERATE_QUIET_STAGE
+            elif stage == GENERATE_QUIET_STAGE:
+                self.fill(QUIET_MOVES)
+                self.stage = QUIET_STAGE
+            elif stage == QUIET_STAGE:
+                move = self.select()
+                if move:
+                    return move
+                self.stage = DONE_STAGE
+            else:
+                return 0
+
+    def is_legal(self, move : int, kind : int) -> bool:
+        """Checks a move from the transposition table or the killer table by generating the moves of its piece only"""
+        return move in self.position.legal_moves(self.color, kind, 1 << (move & 63))
+
+    def fill(self, kind : int):
+        """Generates one stage into the buffer and scores it, leaving out the moves already handed out"""
+        start = time.perf_counter() if self.stats is not None else 0
+        position = self.position
+        color = self.color
+        moves = self.moves
+        scores = self.scores
+        skip = (self.tt_move, *self.killers_played)
+        count = 0
+        if kind == NOISY_MOVES:
+            score = self.orderer.score
+            ply = self.ply
+            for move in position.legal_moves(color, NOISY_MOVES):
+                self.generated += 1
+                if move not in skip:
+                    moves[count] = move
+                    scores[count] = score(position, move, color, ply)
+                    count += 1
+        else:
+            history = self.orderer.history
+            offset = color << 12
+            for move in position.legal_moves(color, QUIET_MOVES):
+                self.generated += 1
+                if move not in skip:
+                    moves[count] = move
+                    scores[count] = history[offset | move & 4095]
+                    count += 1
+        self.count = count
+        self.index = 0
+        if self.stats is not None:
+            self.stats.phase_times["movegen"] += time.perf_counter() - start
+
+    def select(self) -> int:
+        """Swaps the best scored of the remaining buffered moves to the front and returns it, 0 if none are left"""
+        index = self.index
+        if index >= self.count:
+            return 0
+        scores = self.scores
+        moves = self.moves
+        best = max(range(index, self.count), key=scores.__getitem__)
+        moves[index], moves[best] = moves[best], moves[index]
+        scores[index], scores[best] = scores[best], scores[index]
+        self.index = index + 1
+        return moves[index]
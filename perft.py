@@ -0,0 +1,99 @@
+"""Perft: counts the leaf nodes of the move generator to a fixed depth, to check its correctness and measure its speed"""
+import argparse
+import time
+from board import Position, STARTING_FEN
+from models import move_to_uci
+
+#Reference positions with their known leaf counts from depth 1 upwards
+REFERENCE_POSITIONS = [
+    ("startpos", STARTING_FEN, (20, 400, 8902, 197281, 4865609)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862, 4085603)),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238, 674624)),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 264, 9467, 422333)),
+    ("discovered", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (44, 1486, 62379, 2103487)),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", (46, 2079, 89890, 3894594)),
+]
+KEY_CHECK_DEPTH = 3 #deepest the suite compares incremental keys with keys computed from scratch, which is slow
+
+def perft(position : Position, depth : int) -> int:
+    """Counts the leaf nodes reachable from the position in exactly the given number of moves"""
+    if depth == 0:
+        return 1
+    moves = list(position.legal_moves(position.turn))
+    if depth == 1: #the moves themselves are the leaves, no need to play them
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.push(move)
+        nodes += perft(position, depth - 1)
+        position.pop()
+    return nodes
+
+def check_keys(position : Position, depth : int) -> int:
+    """Plays every line to the given depth, returns how many times the incremental Zobrist key differed from one
+    computed from scratch after a push or a pop"""
+    if depth == 0:
+        return 0
+    errors = 0
+    for move in list(position.legal_moves(position.turn)):
+        position.push(move)
+        errors += (position.key != position.compute_key()) + check_keys(position, depth - 1)
+        position.pop()
+        errors += position.key != position.compute_key()
+    return errors
+
+def divide(position : Position, depth : int) -> dict:
+    """Counts the leaf nodes under each root move separately, to track down which move a wrong count comes from"""
+    counts = {}
+    for move in list(position.legal_moves(position.turn)):
+        position.push(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.pop()
+    return counts
+
+def run(fen : str, depth : int, show_divide : bool = False, expected : int = None) -> bool:
+    """Runs perft on one position and prints the node count, time and speed, returns whether the count is as expected"""
+    position = Position(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        for move, count in sorted(counts.items()):
+            print(f"{move}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    result = "" if expected is None else (" OK" if nodes == expected else f" FAILED, expected {expected}")
+    print(f"depth {depth} nodes {nodes} time {elapsed:.3f}s nps {nodes / elapsed if elapsed else 0:.0f}{result}")
+    return expected is None or nodes == expected
+
+def run_suite(depth : int) -> bool:
+    """Runs every reference position up to the given depth (or its deepest known count), returns whether all counts matched"""
+    passed = True
+    for name, fen, counts in REFERENCE_POSITIONS:
+        print(f"{name}: {fen}")
+        for current_depth in range(1, min(depth, len(counts)) + 1):
+            passed = run(fen, current_depth, expected=counts[current_depth - 1]) and passed
+        errors = check_keys(Position(fen), min(depth, KEY_CHECK_DEPTH))
+        print(f"keys {'OK' if not errors else f'FAILED, {errors} mismatches'}")
+        passed = passed and not errors
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes to check correctness and measure speed")
+    parser.add_argument("--fen", default=None, help="position to count from, the starting position by default")
+    parser.add_argument("--depth", type=int, default=3, help="number of moves to look ahead")
+    parser.add_argument("--divide", action="store_true", help="show the count under each root move")
+    parser.add_argument("--suite", action="store_true", help="check every reference position against its known counts")
+    args = parser.parse_args()
+
+    if args.suite:
+        passed = run_suite(args.depth)
+    else:
+        fen = args.fen or STARTING_FEN
+        known = {reference_fen: counts for _, reference_fen, counts in REFERENCE_POSITIONS}.get(fen, ())
+        passed = run(fen, args.depth, args.divide, known[args.depth - 1] if args.depth <= len(known) else None)
+    raise SystemExit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
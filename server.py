@@ -0,0 +1,263 @@
+"""Game server: many concurrent games over a line-based TCP or Unix socket protocol, with engine searches run in a process pool.
+
+Commands, one per line, answered with one line each unless noted:
+    new [movetime <ms>] [budget <ms>] [fen <fen>]   starts a game, answers "game <id>"
+    move <id> <uci>                                 plays a move, the engine's reply follows later as "bestmove <id> ..."
+    go <id>                                         asks the engine to move in the current position, answered later
+    show <id>                                       answers "fen <id> <fen>"
+    close <id>                                      ends a game, answers "closed <id>"
+    stats                                           answers with the number of games, queue depth and move latency percentiles
+    quit                                            closes the connection
+A connection can only use the games it started. Errors are answered with "error <message>", the end of a game with
+"gameover <id> <result>"."""
+import argparse
+import asyncio
+import collections
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from analysis import analyze_position
+from board import Board, Position
+from bitboard import COLOR_NAMES
+from models import CAPTURE, uci_to_move
+
+DEFAULT_PORT = 8765
+DEFAULT_MOVETIME_MS = 1000 #longest the engine thinks about a single move
+DEFAULT_BUDGET_MS = 60000 #engine thinking time for a whole game
+MIN_MOVETIME_MS = 10
+MOVES_TO_GO = 20 #share of the remaining budget spent on each move
+DEFAULT_HASH_MB = 2 #per search, kept small since many searches run at once
+LATENCY_SAMPLES = 10000 #most recent move latencies kept for the percentiles
+
+class GameSession:
+    """One game: its board and the engine's remaining thinking time"""
+    __slots__ = ('board', 'movetime_ms', 'budget_ms', 'thinking')
+
+    def __init__(self, board : Board, movetime_ms : int, budget_ms : int):
+        self.board = board
+        self.movetime_ms = movetime_ms
+        self.budget_ms = budget_ms
+        self.thinking = False #a search for this game is queued or running, moves are refused until it is done
+
+    def move_time(self) -> int:
+        """Milliseconds the engine may spend on its next move"""
+        return max(MIN_MOVETIME_MS, min(self.movetime_ms, self.budget_ms // MOVES_TO_GO))
+
+    def result(self) -> str:
+        """How the game ended for the side to move, None if it goes on"""
+        color = COLOR_NAMES[self.board.position.turn]
+        if self.board.is_in_checkmate(color):
+            return "checkmate"
+        if self.board.is_in_stalemate(color):
+            return "stalemate"
+        if self.board.position.halfmove_clock >= 100:
+            return "fiftymoves"
+        return None
+
+def percentile(values : list, fraction : float) -> float:
+    """Value below which the given fraction of the sorted values fall"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class GameServer:
+    """Holds the games and feeds their engine searches to a bounded process pool. Searches wait in a bounded queue,
+    a connection that fills it is paused until there is room again, so clients cannot queue unlimited work"""
+    def __init__(self, workers : int = 2, max_queue : int = 256, max_games : int = 10000,
+                 movetime_ms : int = DEFAULT_MOVETIME_MS, budget_ms : int = DEFAULT_BUDGET_MS, hash_mb : float = DEFAULT_HASH_MB):
+        self.workers = workers
+        self.max_games = max_games
+        self.movetime_ms = movetime_ms
+        self.budget_ms = budget_ms
+        self.hash_mb = hash_mb
+        self.games = {}
+        self.game_ids = itertools.count(1)
+        self.queue = asyncio.Queue(max_queue)
+        self.searching = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES) #seconds from queueing a search to sending its move
+        self.moves_played = 0
+        self.pool = None
+        self.tasks = []
+
+    async def start(self, host : str = "127.0.0.1", port : int = DEFAULT_PORT, path : str = None):
+        """Starts the worker pool and listens on a TCP port, or on a Unix socket if a path is given"""
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.tasks = [asyncio.create_task(self.search_worker()) for _ in range(self.workers)]
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_client, path)
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    def close(self):
+        """Stops the search workers and the pool"""
+        for task in self.tasks:
+            task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def handle_client(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        """Answers the commands of one connection until it quits or disconnects, then drops the games it left open"""
+        owned = set() #ids of the games this connection started and has not closed
+        try:
+            while line := await reader.readline():
+                if not await self.handle(line.decode(errors="replace").strip(), writer, owned):
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in owned:
+                self.games.pop(game_id, None)
+            writer.close()
+
+    async def handle(self, line : str, writer : asyncio.StreamWriter, owned : set) -> bool:
+        """Handles a single command, returns False when the connection should be closed.
+        owned holds the ids of the connection's games, the only ones it may use, which are dropped when it goes away"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        match(tokens[0]):
+            case "new":
+                game_id = self.new_game(tokens, writer)
+                if game_id is not None:
+                    owned.add(game_id)
+            case "move" | "go" | "show" | "close" if len(tokens) < 2 or tokens[1] not in owned or tokens[1] not in self.games:
+                send(writer, "error unknown game")
+            case "move" if len(tokens) == 3:
+                await self.play_move(tokens[1], tokens[2], writer)
+            case "go":
+                await self.request_search(tokens[1], writer)
+            case "show":
+                send(writer, f"fen {tokens[1]} {self.games[tokens[1]].board.board_to_fen()}")
+            case "close":
+                del self.games[tokens[1]]
+                owned.discard(tokens[1])
+                send(writer, f"closed {tokens[1]}")
+            case "stats":
+                send(writer, self.stats_line())
+            case "quit":
+                return False
+            case _:
+                send(writer, "error unknown command")
+        return True
+
+    def new_game(self, tokens : list[str], writer : asyncio.StreamWriter) -> str:
+        """new [movetime <ms>] [budget <ms>] [fen <fen>], returns the id of the game started or None"""
+        if len(self.games) >= self.max_games:
+            send(writer, "error too many games")
+            return None
+        options = dict(zip(tokens[1:], tokens[2:]))
+        board = Board()
+        if "fen" in tokens:
+            try:
+                board.position = Position(" ".join(tokens[tokens.index("fen") + 1:]))
+            except (ValueError, IndexError):
+                send(writer, "error invalid fen")
+                return None
+        movetime_ms = int(options["movetime"]) if options.get("movetime", "").isdigit() else self.movetime_ms
+        budget_ms = int(options["budget"]) if options.get("budget", "").isdigit() else self.budget_ms
+        game_id = str(next(self.game_ids))
+        self.games[game_id] = GameSession(board, movetime_ms, budget_ms)
+        send(writer, f"game {game_id}")
+        return game_id
+
+    async def play_move(self, game_id : str, text : str, writer : asyncio.StreamWriter):
+        """Plays the player's move if it is legal and queues the engine's reply"""
+        session = self.games[game_id]
+        if session.thinking:
+            send(writer, f"error {game_id} engine is thinking")
+            return
+        position = session.board.position
+        legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+        try:
+            move = legal.get(uci_to_move(text))
+        except (ValueError, IndexError):
+            move = None
+        if move is None:
+            send(writer, f"error {game_id} illegal move {text}")
+            return
+        position.push(move)
+        await self.request_search(game_id, writer)
+
+    async def request_search(self, game_id : str, writer : asyncio.StreamWriter):
+        """Queues a search for the game's current position, waiting while the queue is full"""
+        session = self.games[game_id]
+        if session.thinking:
+            send(writer, f"error {game_id} engine is thinking")
+            return
+        result = session.result()
+        if result is not None:
+            send(writer, f"gameover {game_id} {result}")
+            return
+        session.thinking = True
+        await self.queue.put((game_id, session, writer, time.perf_counter()))
+
+    async def search_worker(self):
+        """Takes searches off the queue and runs them in the pool, the event loop only waits for their results"""
+        loop = asyncio.get_running_loop()
+        while True:
+            game_id, session, writer, queued = await self.queue.get()
+            self.searching += 1
+            try:
+                fen = session.board.board_to_fen()
+                result = await loop.run_in_executor(self.pool, analyze_position, 0, fen, None, session.move_time(), None, self.hash_mb)
+            except Exception as exception: #a failed search must not stop the worker
+                send(writer, f"error {game_id} search failed: {exception}")
+                session.thinking = False
+                continue
+            finally:
+                self.searching -= 1
+                self.queue.task_done()
+            session.budget_ms = max(0, session.budget_ms - result["time_ms"])
+            session.thinking = False
+            if self.games.get(game_id) is not session or result["bestmove"] is None: #closed while searching
+                continue
+            position = session.board.position
+            legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+            position.push(legal[uci_to_move(result["bestmove"])])
+            self.moves_played += 1
+            self.latencies.append(time.perf_counter() - queued)
+            send(writer, f"bestmove {game_id} {result['bestmove']} score {result['score']} depth {result['depth']}")
+            game_result = session.result()
+            if game_result is not None:
+                send(writer, f"gameover {game_id} {game_result}")
+
+    def stats_line(self) -> str:
+        """Games in memory, searches queued and running, and percentiles of the recent move latencies in milliseconds"""
+        latencies = sorted(self.latencies)
+        return (f"stats games {len(self.games)} queue {self.queue.qsize()} searching {self.searching} moves {self.moves_played} "
+                f"p50 {percentile(latencies, 0.5) * 1000:.0f} p90 {percentile(latencies, 0.9) * 1000:.0f} "
+                f"p99 {percentile(latencies, 0.99) * 1000:.0f}")
+
+def send(writer : asyncio.StreamWriter, line : str):
+    """Writes a line to a client, lines for a client that has gone away are dropped"""
+    if not writer.is_closing():
+        writer.write((line + "\n").encode())
+
+async def serve(args):
+    server = GameServer(args.workers, args.max_queue, args.max_games, args.movetime, args.budget, args.hash)
+    listener = await server.start(args.host, args.port, args.unix)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many concurrent games over a line-based socket protocol")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=2, help="engine processes searching at once")
+    parser.add_argument("--max-queue", type=int, default=256, help="searches that may wait for a worker before clients are paused")
+    parser.add_argument("--max-games", type=int, default=10000, help="games held in memory at once")
+    parser.add_argument("--movetime", type=int, default=DEFAULT_MOVETIME_MS, help="longest engine search per move in milliseconds")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET_MS, help="engine thinking time per game in milliseconds")
+    parser.add_argument("--hash", type=float, default=DEFAULT_HASH_MB, help="transposition table size per search in MB")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Search instrumentation: counters and phase timers collected when attached to an engine, and a profiling hook"""
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+
+PHASES = ("movegen", "evaluation", "transposition") #parts of the search timed separately
+
+class SearchStats:
+    """Counters of one search, attach an instance to Engine.stats to collect them, the engine skips all of this when it is None"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clears every counter, called at the start of each search"""
+        self.nodes = 0 #positions visited by the search, quiescence included
+        self.qnodes = 0 #positions visited by the quiescence search
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0 #nodes answered by the transposition table without searching
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0 #beta cutoffs caused by the first move searched, a measure of move ordering
+        self.moves_generated = 0
+        self.evaluations = 0
+        self.null_move_cutoffs = 0
+        self.reverse_futility_cutoffs = 0
+        self.futility_pruned = 0 #quiet moves skipped near the leaves
+        self.reductions = 0 #late moves searched to a reduced depth
+        self.re_searches = 0 #reduced moves that beat alpha and were searched again at full depth
+        self.extensions = 0
+        self.iteration_nodes = [] #nodes searched by each iteration of iterative deepening
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+
+    def timed(self, phase : str, function, *args):
+        """Calls the function, adding the time it takes to the phase"""
+        start = time.perf_counter()
+        result = function(*args)
+        self.phase_times[phase] += time.perf_counter() - start
+        return result
+
+    def finish(self, nodes : int):
+        """Records the totals once the search is over"""
+        self.nodes = nodes
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def merge(self, counters : dict):
+        """Adds the counters of another search, as returned by as_dict, e.g. from a worker process of a parallel search"""
+        for name in ("qnodes", "tt_probes", "tt_hits", "tt_cutoffs", "beta_cutoffs", "first_move_cutoffs", "moves_generated",
+                     "evaluations", "null_move_cutoffs", "reverse_futility_cutoffs", "futility_pruned", "reductions", "re_searches",
+                     "extensions"):
+            setattr(self, name, getattr(self, name) + counters[name])
+        for depth, nodes in enumerate(counters["iteration_nodes"]):
+            if depth < len(self.iteration_nodes):
+                self.iteration_nodes[depth] += nodes
+            else:
+                self.iteration_nodes.append(nodes)
+        for phase, elapsed in counters["phase_times"].items():
+            self.phase_times[phase] += elapsed
+
+    def effective_branching_factor(self) -> float:
+        """Growth in nodes between the last two iterations, None before the second iteration"""
+        if len(self.iteration_nodes) < 2 or not self.iteration_nodes[-2]:
+            return None
+        return self.iteration_nodes[-1] / self.iteration_nodes[-2]
+
+    def as_dict(self) -> dict:
+        """Every counter and the rates derived from them, ready to be written as JSON"""
+        return {
+            "nodes": self.nodes,
+            "qnodes": self.qnodes,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_hit_rate": self.tt_hits / self.tt_probes if self.tt_probes else 0.0,
+            "tt_cutoffs": self.tt_cutoffs,
+            "beta_cutoffs": self.beta_cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0,
+            "moves_generated": self.moves_generated,
+            "evaluations": self.evaluations,
+            "null_move_cutoffs": self.null_move_cutoffs,
+            "reverse_futility_cutoffs": self.reverse_futility_cutoffs,
+            "futility_pruned": self.futility_pruned,
+            "reductions": self.reductions,
+            "re_searches": self.re_searches,
+            "extensions": self.extensions,
+            "iteration_nodes": list(self.iteration_nodes),
+            "effective_branching_factor": self.effective_branching_factor(),
+            "phase_times": dict(self.phase_times),
+            "time": self.elapsed,
+            "nps": self.nodes / self.elapsed if self.elapsed else 0.0,
+        }
+
+    def to_json(self) -> str:
+        """The counters of as_dict as a JSON string"""
+        return json.dumps(self.as_dict())
+
+def profile_search(engine, depth : int = None, movetime_ms : int = None, nodes : int = None, limit : int = 25,
+                   sort : str = "cumulative", output = sys.stdout):
+    """Runs a single search under cProfile and writes its hottest functions to output, returns the move found"""
+    profiler = cProfile.Profile()
+    move = profiler.runcall(engine.search, depth, movetime_ms, nodes)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+    output.write(report.getvalue())
+    return move
@@ -0,0 +1,395 @@
+"""Endgame tablebases: retrograde analysis of endings with few pieces, stored as one byte per position (up to the board's
+symmetries) and probed through mmap"""
+import argparse
+import mmap
+import os
+import time
+from board import Position
+from attacks import KNIGHT_ATTACKS, KING_ATTACKS, bishop_attacks, rook_attacks, queen_attacks
+from bitboard import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, PIECE_CHARACTERS, MATERIAL_VALUES, RANK_1, RANK_4, RANK_5, RANK_8, \
+    iterate_bits, popcount
+from models import CAPTURE, move_to_uci
+
+#Each position is stored as one byte: DRAW, INVALID (not a legal position) or the distance to mate in plies plus one,
+#an even distance means the side to move is mated, an odd distance means the side to move mates
+DRAW = 0
+INVALID = 255
+MAX_PLIES = 253
+WIN = 1
+LOSS = -1
+
+SIDE_ORDER = "KQRBNP" #order of the pieces within each side of a signature, e.g. KRPvKR
+DEFAULT_DIRECTORY = "tables"
+DEFAULT_SIGNATURES = ("KQvK", "KRvK", "KBvK", "KNvK", "KPvK")
+
+def side_string(position : Position, color : int) -> str:
+    """Pieces of one side in signature order"""
+    pieces = position.bitboards[color]
+    return "".join(character * popcount(pieces[PIECE_CHARACTERS.index(character)]) for character in SIDE_ORDER)
+
+def strength(side : str) -> tuple:
+    """Orders the sides of a signature, the stronger side is written first"""
+    return (sum(MATERIAL_VALUES[PIECE_CHARACTERS.index(character)] for character in side), len(side), side)
+
+def canonical_signature(white : str, black : str) -> tuple[str, bool]:
+    """Signature of the ending with the stronger side first, and whether the colors have to be flipped to use it"""
+    if strength(white) >= strength(black):
+        return f"{white}v{black}", False
+    return f"{black}v{white}", True
+
+def parse_signature(signature : str) -> tuple[str, str]:
+    """Splits a signature such as KQvK into its two sides, raises ValueError if it is malformed"""
+    sides = signature.upper().split("V")
+    if len(sides) != 2 or any(not side.startswith("K") or "K" in side[1:] or set(side) - set(SIDE_ORDER) for side in sides):
+        raise ValueError(f"invalid signature {signature}")
+    white, black = ("".join(sorted(side, key=SIDE_ORDER.index)) for side in sides)
+    return white, black
+
+def slot_pieces(signature : str) -> list[tuple[int, int]]:
+    """(color, piece type) of every slot of the index, white pieces first"""
+    white, black = parse_signature(signature)
+    return [(WHITE, PIECE_CHARACTERS.index(character)) for character in white] + \
+        [(BLACK, PIECE_CHARACTERS.index(character)) for character in black]
+
+def _symmetry(flip_file : bool, flip_rank : bool, transpose : bool) -> list[int]:
+    """Square map of one symmetry of the board"""
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        if transpose:
+            rank, file = file, rank
+        table.append((7 - rank if flip_rank else rank) * 8 + (7 - file if flip_file else file))
+    return table
+
+#Symmetries of the board as square maps, the first two (identity and left-right mirror) are the only ones that keep pawns moving forwards
+SYMMETRIES = [_symmetry(flip_file, flip_rank, transpose) for flip_rank in (False, True) for transpose in (False, True)
+              for flip_file in (False, True)]
+
+class TableLayout:
+    """Index of the positions of a signature: the side to move, the two kings as one of the legal king pairs, then each other
+    piece's square (48 for a pawn, which can never stand on the first or last rank). Each position is mapped by the board's
+    symmetries so the white king stands in the a1-d1-d4 triangle, or on files a to d when there are pawns, and the smallest of
+    the indices this allows is used, so every position has one index and the others are never used"""
+    def __init__(self, signature : str):
+        self.pieces = slot_pieces(signature)
+        pawns = any(piece_type == PAWN for _, piece_type in self.pieces)
+        self.symmetries = SYMMETRIES[:2] if pawns else SYMMETRIES
+        self.black_king = len(parse_signature(signature)[0])
+        self.other_slots = [slot for slot in range(len(self.pieces)) if slot not in (0, self.black_king)]
+        self.slot_sizes = [48 if piece_type == PAWN else 64 for _, piece_type in self.pieces]
+        self.groups = [] #runs of slots holding the same piece, their squares are kept sorted
+        slot = 0
+        while slot < len(self.pieces):
+            end = slot
+            while end + 1 < len(self.pieces) and self.pieces[end + 1] == self.pieces[slot]:
+                end += 1
+            if end > slot:
+                self.groups.append((slot, end + 1))
+            slot = end + 1
+        white_kings = [square for square in range(64) if square % 8 < 4 and (pawns or square // 8 <= square % 8)]
+        self.king_pairs = [(white_king, black_king) for white_king in white_kings for black_king in range(64)
+                           if black_king != white_king and not KING_ATTACKS[white_king] >> black_king & 1]
+        self.pair_index = {pair: index for index, pair in enumerate(self.king_pairs)}
+        self.size = 2 * len(self.king_pairs)
+        for slot in self.other_slots:
+            self.size *= self.slot_sizes[slot]
+
+    def index(self, squares : list[int], turn : int) -> int:
+        """Index of the position with the pieces on the given squares in slot order, None if the kings touch"""
+        best = None
+        for table in self.symmetries:
+            pair = self.pair_index.get((table[squares[0]], table[squares[self.black_king]]))
+            if pair is None:
+                continue
+            mapped = [table[square] for square in squares]
+            for start, end in self.groups:
+                mapped[start:end] = sorted(mapped[start:end])
+            index = turn * len(self.king_pairs) + pair
+            for slot in self.other_slots:
+                index = index * self.slot_sizes[slot] + (mapped[slot] - 8 if self.slot_sizes[slot] == 48 else mapped[slot])
+            if best is None or index < best:
+                best = index
+        return best
+
+    def squares(self, index : int) -> tuple[list[int], int]:
+        """The squares in slot order and the side to move of an index"""
+        squares = [0] * len(self.pieces)
+        for slot in reversed(self.other_slots):
+            index, square = divmod(index, self.slot_sizes[slot])
+            squares[slot] = square + 8 if self.slot_sizes[slot] == 48 else square
+        turn, pair = divmod(index, len(self.king_pairs))
+        squares[0], squares[self.black_king] = self.king_pairs[pair]
+        return squares, turn
+
+_layouts = {}
+
+def table_layout(signature : str) -> TableLayout:
+    """Layout of a signature, built once"""
+    if signature not in _layouts:
+        _layouts[signature] = TableLayout(signature)
+    return _layouts[signature]
+
+def position_index(position : Position, signature : str, flipped : bool) -> int:
+    """Index of the position in the table of the signature, see TableLayout.
+    Flipped positions are looked up with the colors swapped and the board mirrored vertically"""
+    squares = {}
+    for color in (WHITE, BLACK):
+        for piece_type, pieces in enumerate(position.bitboards[color]):
+            squares[color ^ flipped, piece_type] = [square ^ 56 if flipped else square for square in iterate_bits(pieces)]
+    layout = table_layout(signature)
+    return layout.index([squares[piece].pop() for piece in layout.pieces], position.turn ^ flipped)
+
+class Tablebase:
+    """Tables of a directory, one file per signature, mapped into memory as they are first needed"""
+    def __init__(self, directory : str = DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+        self.files = []
+        signatures = [name[:-3] for name in os.listdir(directory) if name.endswith(".tb")] if os.path.isdir(directory) else []
+        self.max_pieces = max((len(signature) - 1 for signature in signatures), default=2)
+
+    def close(self):
+        """Closes every mapped table"""
+        for table in self.tables.values():
+            if isinstance(table, mmap.mmap):
+                table.close()
+        for file in self.files:
+            file.close()
+        self.tables.clear()
+        self.files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def table(self, signature : str):
+        """The table of a signature, None if its file does not exist"""
+        if signature not in self.tables:
+            path = os.path.join(self.directory, f"{signature}.tb")
+            if not os.path.exists(path):
+                self.tables[signature] = None
+            else:
+                if os.path.getsize(path) != table_layout(signature).size:
+                    raise ValueError(f"{path} does not match the table layout, generate it again")
+                file = open(path, 'rb')
+                self.files.append(file)
+                self.tables[signature] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.tables[signature]
+
+    def value(self, position : Position) -> int:
+        """Stored byte of the position, None if its table is not available or the position has no index (touching kings)"""
+        signature, flipped = canonical_signature(side_string(position, WHITE), side_string(position, BLACK))
+        if signature == "KvK":
+            return DRAW
+        table = self.table(signature)
+        if table is None:
+            return None
+        index = position_index(position, signature, flipped)
+        return None if index is None else table[index]
+
+    def probe(self, position : Position) -> tuple[int, int]:
+        """Returns (WIN, DRAW or LOSS for the side to move, plies to mate) or None if the position is not covered.
+        Castling rights and en passant captures are not part of the tables, so such positions are never covered"""
+        if position.occupied.bit_count() > self.max_pieces or position.castling:
+            return None
+        if position.en_passant is not None and position.bitboards[position.turn][PAWN]:
+            return None
+        value = self.value(position)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW:
+            return DRAW, 0
+        plies = value - 1
+        return (WIN if plies % 2 else LOSS), plies
+
+    def best_move(self, position : Position) -> int:
+        """Returns the move that keeps the best result, mating as fast or resisting as long as possible, None if not covered"""
+        if self.probe(position) is None:
+            return None
+        best_key = None
+        best_move = None
+        for move in list(position.legal_moves(position.turn)):
+            position.push(move)
+            entry = self.probe(position)
+            position.pop()
+            if entry is None:
+                continue
+            result, plies = entry
+            key = (-result, -plies if result == LOSS else plies)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_move = move
+        return best_move
+
+def child_signatures(signature : str) -> set[str]:
+    """Signatures a capture or a promotion leads to from the given one"""
+    white, black = parse_signature(signature)
+    children = set()
+    for side, other in ((white, black), (black, white)):
+        for index, character in enumerate(side):
+            if character == "K":
+                continue
+            remaining = side[:index] + side[index + 1:]
+            children.add(canonical_signature(remaining, other)[0])
+            if character == "P":
+                for promotion in "QRBN":
+                    promoted = "".join(sorted(remaining + promotion, key=SIDE_ORDER.index))
+                    children.add(canonical_signature(promoted, other)[0])
+    children.discard("KvK")
+    return children
+
+def unmove_parents(layout : TableLayout, squares : list[int], turn : int) -> set[int]:
+    """Indices of the positions that reach the given one with a move that is neither a capture nor a promotion,
+    found by moving the pieces of the side that just moved backwards"""
+    mover = turn ^ 1
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    parents = set()
+    for slot, (color, piece_type) in enumerate(layout.pieces):
+        if color != mover:
+            continue
+        square = squares[slot]
+        if piece_type == PAWN:
+            step = -8 if color == WHITE else 8
+            origin = square + step
+            targets = []
+            if not occupied >> origin & 1 and not (1 << origin) & (RANK_1 | RANK_8):
+                targets.append(origin)
+                if (1 << square) & (RANK_4 if color == WHITE else RANK_5) and not occupied >> origin + step & 1:
+                    targets.append(origin + step)
+        elif piece_type == KNIGHT:
+            targets = iterate_bits(KNIGHT_ATTACKS[square] & ~occupied)
+        elif piece_type == BISHOP:
+            targets = iterate_bits(bishop_attacks(square, occupied) & ~occupied)
+        elif piece_type == ROOK:
+            targets = iterate_bits(rook_attacks(square, occupied) & ~occupied)
+        elif piece_type == QUEEN:
+            targets = iterate_bits(queen_attacks(square, occupied) & ~occupied)
+        else:
+            targets = iterate_bits(KING_ATTACKS[square] & ~occupied)
+        for target in targets:
+            parent = list(squares)
+            parent[slot] = target
+            index = layout.index(parent, mover)
+            if index is not None:
+                parents.add(index)
+    return parents
+
+def generate(signature : str, directory : str = DEFAULT_DIRECTORY, log = print) -> str:
+    """Generates the table of a signature and the tables it depends on, skipping those that already exist.
+    Every position is expanded once with the move generator to count the different positions its moves lead to, then the
+    results are propagated backwards from the checkmates one ply at a time, finding the positions before each newly
+    resolved one by moving its pieces backwards, so no moves are kept in memory. Returns the table's path"""
+    white, black = parse_signature(signature)
+    signature, _ = canonical_signature(white, black)
+    path = os.path.join(directory, f"{signature}.tb")
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    for child in sorted(child_signatures(signature)):
+        generate(child, directory, log)
+    start = time.perf_counter()
+
+    layout = table_layout(signature)
+    pieces = layout.pieces
+    size = layout.size
+    values = bytearray([INVALID]) * size
+    remaining = bytearray(size) #moves of each position whose result is not known yet, moves to the same position count once
+    exits = {} #plies of the child -> (parent, whether the child is lost) for captures and promotions
+    frontier = [] #positions resolved at the current number of plies, starting with the checkmates
+
+    position = Position()
+    position.clear()
+    with Tablebase(directory) as tables:
+        for index in range(size):
+            squares, turn = layout.squares(index)
+            if len(set(squares)) < len(squares) or layout.index(squares, turn) != index:
+                continue
+            for square in iterate_bits(position.occupied):
+                position.remove_piece(square)
+            for square, (color, piece_type) in zip(squares, pieces):
+                position.put_piece(square, color, piece_type)
+            position.turn = turn
+            if position.in_check(turn ^ 1):
+                continue
+            values[index] = DRAW
+            slots = {square: slot for slot, square in enumerate(squares)}
+            moves = list(position.legal_moves(turn))
+            if not moves:
+                if position.in_check(turn):
+                    values[index] = 1
+                    frontier.append(index)
+                continue
+            children = set()
+            exit_moves = 0
+            for move in moves:
+                start_square = move & 63
+                end_square = move >> 6 & 63
+                if move & CAPTURE or (pieces[slots[start_square]][1] == PAWN and (1 << end_square) & (RANK_1 | RANK_8)):
+                    exit_moves += 1
+                    position.push(move)
+                    value = tables.value(position)
+                    position.pop()
+                    if value != DRAW:
+                        plies = value - 1
+                        exits.setdefault(plies, []).append((index, plies % 2 == 0))
+                    continue
+                child = list(squares)
+                child[slots[start_square]] = end_square
+                children.add(layout.index(child, turn ^ 1))
+            remaining[index] = len(children) + exit_moves
+    log(f"{signature}: {size} positions expanded in {time.perf_counter() - start:.1f}s")
+
+    plies = 0
+    last_exit = max(exits, default=-1)
+    while frontier or plies <= last_exit:
+        if plies + 2 > MAX_PLIES:
+            raise ValueError(f"{signature} has mates longer than {MAX_PLIES} plies")
+        resolved = []
+        lost = plies % 2 == 0
+        updates = [(parent, child_lost) for parent, child_lost in exits.get(plies, ())]
+        for child in frontier:
+            updates.extend((parent, lost) for parent in unmove_parents(layout, *layout.squares(child)))
+        for parent, child_lost in updates:
+            if values[parent] != DRAW:
+                continue
+            if not child_lost:
+                remaining[parent] -= 1
+                if remaining[parent]:
+                    continue
+            values[parent] = plies + 2
+            resolved.append(parent)
+        frontier = resolved
+        plies += 1
+
+    with open(path, 'wb') as file:
+        file.write(values)
+    log(f"{signature}: written to {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases, or look up a position in them")
+    parser.add_argument("signatures", nargs='*', default=DEFAULT_SIGNATURES, help="material signatures to generate, e.g. KQvK KRvK")
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY, help="directory the tables are stored in")
+    parser.add_argument("--probe", default=None, help="FEN of a position to look up instead of generating")
+    args = parser.parse_args()
+
+    if args.probe:
+        with Tablebase(args.directory) as tablebase:
+            position = Position(args.probe)
+            entry = tablebase.probe(position)
+            if entry is None:
+                print("not covered")
+            else:
+                result, plies = entry
+                move = tablebase.best_move(position)
+                print(f"{('draw', 'win', 'loss')[result]} in {plies} plies, best move {'none' if move is None else move_to_uci(move)}")
+    else:
+        for signature in args.signatures:
+            generate(signature, args.directory)
+
+if __name__ == '__main__':
+    main()
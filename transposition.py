@@ -0,0 +1,67 @@
+"""Fixed-size transposition table for the search, keyed by Zobrist keys"""
+from array import array
+
+#Bound types of a stored score
+EXACT = 0
+LOWER_BOUND = 1 #the search failed high, the real score is at least this
+UPPER_BOUND = 2 #the search failed low, the real score is at most this
+
+#Each entry is two 64-bit words: the full key, then the data packed as
+#move (bits 0-15), score offset by SCORE_OFFSET (bits 16-47), depth (bits 48-55), bound (bits 56-57) and generation (bits 58-63)
+SCORE_OFFSET = 1 << 31
+ENTRY_BYTES = 16
+#Each bucket holds two entries: the first keeps the deepest search, the second is always replaced
+BUCKET_BYTES = 2 * ENTRY_BYTES
+
+class TranspositionTable:
+    """Bucketed hash table of search results, its memory use is fixed when it is created"""
+    def __init__(self, size_mb : float = 16):
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // BUCKET_BYTES)
+        self.table = array('Q', bytes(self.buckets * BUCKET_BYTES)) #four words per bucket, all zero means empty
+        self.generation = 0 #entries from older searches can be replaced regardless of depth
+        self.hits = 0
+
+    def clear(self):
+        """Remove every entry"""
+        self.table = array('Q', bytes(self.buckets * BUCKET_BYTES))
+        self.generation = 0
+        self.hits = 0
+
+    def new_search(self):
+        """Marks the entries stored so far as belonging to an older search"""
+        self.generation = (self.generation + 1) & 63
+        self.hits = 0
+
+    def probe(self, key : int):
+        """Returns the (move, score, depth, bound) stored for the key, or None if it is not in the table"""
+        index = (key % self.buckets) * 4
+        table = self.table
+        if table[index] == key:
+            data = table[index + 1]
+        elif table[index + 2] == key:
+            data = table[index + 3]
+        else:
+            return None
+        self.hits += 1
+        return data & 0xFFFF, (data >> 16 & 0xFFFFFFFF) - SCORE_OFFSET, data >> 48 & 0xFF, data >> 56 & 3
+
+    def store(self, key : int, move : int, score : int, depth : int, bound : int):
+        """Stores a search result, the depth-preferred entry is only replaced by an equal or deeper search, or if it is from an older search"""
+        index = (key % self.buckets) * 4
+        table = self.table
+        data = move | (score + SCORE_OFFSET) << 16 | depth << 48 | bound << 56 | self.generation << 58
+        replaced = table[index + 1]
+        if table[index] == key or depth >= replaced >> 48 & 0xFF or replaced >> 58 != self.generation:
+            if move == 0 and table[index] == key: #keep the best move of an earlier search of this position
+                data |= replaced & 0xFFFF
+            table[index] = key
+            table[index + 1] = data
+        else:
+            table[index + 2] = key
+            table[index + 3] = data
+
+    def usage(self) -> float:
+        """Fraction of entries in use, sampled from the first thousand buckets"""
+        sample = min(self.buckets, 1000)
+        used = sum(1 for index in range(0, sample * 4, 2) if self.table[index])
+        return used / (sample * 2)
@@ -0,0 +1,191 @@
+"""UCI protocol front-end, so the engine can be used from chess GUIs and match runners"""
+import sys
+import threading
+import time
+from board import Board, Position, STARTING_FEN
+from book import OpeningBook
+from cache import AnalysisCache
+from bitboard import WHITE, COLOR_NAMES
+from engine import Engine, MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, DEFAULT_HASH_MB
+from models import CAPTURE, move_to_uci, uci_to_move
+from tablebase import Tablebase
+from transposition import TranspositionTable
+
+ENGINE_NAME = "pychess"
+MOVE_OVERHEAD_MS = 30 #time kept back from every move for communication delays
+MAX_HASH_MB = 4096
+
+def format_score(score : int) -> str:
+    """Score in UCI notation, centipawns or moves to mate"""
+    if abs(score) >= MATE_THRESHOLD:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+    return f"cp {score}"
+
+def allocate_time(options : dict, color : int) -> int:
+    """Milliseconds to spend on this move from the go command's clock information, None if it has none"""
+    if "movetime" in options:
+        return max(1, options["movetime"] - MOVE_OVERHEAD_MS)
+    remaining = options.get("wtime" if color == WHITE else "btime")
+    if remaining is None:
+        return None
+    increment = options.get("winc" if color == WHITE else "binc", 0)
+    moves_to_go = options.get("movestogo", 30)
+    budget = remaining / max(moves_to_go, 1) + increment * 3 // 4
+    return max(1, int(min(budget, remaining / 2) - MOVE_OVERHEAD_MS))
+
+class UCI:
+    """Reads UCI commands, the search runs on its own thread so stop and isready are answered while it is running"""
+    def __init__(self, output = sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = Board()
+        self.engine = Engine(self.board, 'W', hash_mb=DEFAULT_HASH_MB)
+        self.engine.on_iteration = self.report
+        self.search_thread = None
+        self.infinite = False
+        self.stop_event = threading.Event() #set once a stop arrives, so an infinite search knows it may send its move
+
+    def send(self, line : str):
+        """Writes a line to the GUI"""
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def report(self, engine : Engine):
+        """Sends an info line after each completed search iteration"""
+        elapsed = time.perf_counter() - engine.start_time
+        pv = " ".join(move_to_uci(move) for move in engine.principal_variation(engine.completed_depth))
+        self.send(f"info depth {engine.completed_depth} score {format_score(engine.score)} nodes {engine.nodes} "
+                  f"nps {int(engine.nodes / elapsed) if elapsed else 0} time {int(elapsed * 1000)} pv {pv}")
+
+    def run(self, source = sys.stdin):
+        """Handles commands until quit or the end of the input"""
+        for line in source:
+            if not self.handle(line.strip()):
+                break
+        self.stop_search()
+        if self.engine.cache is not None: #write the batched results before exiting
+            self.engine.cache.close()
+
+    def handle(self, line : str) -> bool:
+        """Handles a single command, returns False when the engine should exit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        match(tokens[0]):
+            case "uci":
+                self.send(f"id name {ENGINE_NAME}")
+                self.send("id author CalderJohnson")
+                self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+                self.send("option name BookFile type string default <empty>")
+                self.send("option name TablebaseDirectory type string default <empty>")
+                self.send("option name AnalysisCache type string default <empty>")
+                self.send("uciok")
+            case "isready":
+                self.send("readyok")
+            case "setoption":
+                self.set_option(tokens)
+            case "ucinewgame":
+                self.stop_search()
+                self.engine.transposition_table.clear()
+                self.engine.ordering.clear()
+            case "position":
+                self.stop_search()
+                self.set_position(tokens)
+            case "go":
+                self.stop_search()
+                self.go(tokens)
+            case "stop":
+                self.stop_search()
+            case "quit":
+                return False
+        return True
+
+    def set_option(self, tokens : list[str]):
+        """setoption name <name> value <value>"""
+        if "name" in tokens and "value" in tokens:
+            name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")]).lower()
+            value = " ".join(tokens[tokens.index("value") + 1:])
+            if name == "hash":
+                try:
+                    hash_mb = float(value)
+                except ValueError:
+                    hash_mb = None
+                if hash_mb is None or not 1 <= hash_mb <= MAX_HASH_MB:
+                    self.send(f"info string invalid hash size {value}")
+                    return
+                self.engine.hash_mb = hash_mb
+                self.engine.transposition_table = TranspositionTable(hash_mb)
+            elif name == "bookfile":
+                if self.engine.book is not None:
+                    self.engine.book.close()
+                self.engine.book = None if value in ("", "<empty>") else OpeningBook(value)
+            elif name == "tablebasedirectory":
+                if self.engine.tablebase is not None:
+                    self.engine.tablebase.close()
+                self.engine.tablebase = None if value in ("", "<empty>") else Tablebase(value)
+            elif name == "analysiscache":
+                if self.engine.cache is not None:
+                    self.engine.cache.close()
+                self.engine.cache = None if value in ("", "<empty>") else AnalysisCache(value)
+
+    def set_position(self, tokens : list[str]):
+        """position [startpos | fen <fen>] [moves <move> ...]"""
+        moves_index = tokens.index("moves") if "moves" in tokens else len(tokens)
+        fen = STARTING_FEN if tokens[1] == "startpos" else " ".join(tokens[2:moves_index])
+        try:
+            position = Position(fen)
+        except (ValueError, IndexError):
+            self.send(f"info string invalid fen {fen}")
+            return
+        for text in tokens[moves_index + 1:]:
+            legal = {move & ~CAPTURE: move for move in position.legal_moves(position.turn)}
+            try:
+                move = legal.get(uci_to_move(text))
+            except (ValueError, IndexError):
+                move = None
+            if move is None: #the rest of the moves cannot be played either
+                self.send(f"info string illegal move {text}")
+                break
+            position.push(move)
+        self.board.position = position
+
+    def go(self, tokens : list[str]):
+        """go [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>] [movetime <ms>] [depth <n>] [nodes <n>] [infinite]"""
+        options = {}
+        for name, value in zip(tokens[1:], tokens[2:]):
+            if name in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes") and value.lstrip('-').isdigit():
+                options[name] = int(value)
+        self.infinite = "infinite" in tokens
+        color = self.board.position.turn
+        self.engine.color = COLOR_NAMES[color]
+        self.engine.enemy_color = COLOR_NAMES[color ^ 1]
+        movetime_ms = None if self.infinite else allocate_time(options, color)
+        depth = options.get("depth", MAX_DEPTH if self.infinite else None)
+        nodes = options.get("nodes")
+        self.stop_event.clear()
+        self.engine.stop_requested = False
+        self.search_thread = threading.Thread(target=self.search, args=(depth, movetime_ms, nodes), daemon=True)
+        self.search_thread.start()
+
+    def search(self, depth : int, movetime_ms : int, nodes : int):
+        """Runs on the search thread, sends the best move once the search is over"""
+        move = self.engine.search(depth, movetime_ms, nodes)
+        if self.infinite: #the best move may only be sent after the GUI stops an infinite search
+            self.stop_event.wait()
+        self.send(f"bestmove {'0000' if move is None else move_to_uci(move.encode())}")
+
+    def stop_search(self):
+        """Stops a running search and waits for it to send its best move"""
+        if self.search_thread is not None:
+            self.engine.stop()
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+def main():
+    UCI().run()
+
+if __name__ == '__main__':
+    main()
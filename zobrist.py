@@ -0,0 +1,10 @@
+"""Zobrist keys for hashing positions"""
+import random
+
+#A fixed seed so every process hashes positions the same way, which shared tables and files on disk rely on
+_generator = random.Random(0x5EED)
+
+PIECE_KEYS = [[[_generator.getrandbits(64) for square in range(64)] for piece_type in range(6)] for color in range(2)] #indexed by color, piece type, square
+CASTLING_KEYS = [_generator.getrandbits(64) for rights in range(16)] #indexed by the castling rights bit flags
+EN_PASSANT_KEYS = [_generator.getrandbits(64) for file in range(8)] #indexed by the file of the en passant square
+BLACK_TO_MOVE_KEY = _generator.getrandbits(64)